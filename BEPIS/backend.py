@@ -0,0 +1,1012 @@
+import re
+import time
+
+import numpy as np
+
+from cypher import parseCountQuery, UnsupportedQuery
+
+'''
+Graph backends for BEPIS.
+Every part of BEPIS talks to the graph through one of these classes:
+    Py2neoBackend  - a running Neo4j instance over Bolt (py2neo), the original setup of the thesis
+    InMemoryBackend - an in-process graph engine that keeps Person nodes in columnar numpy arrays and
+                      relationships in edge arrays, so counting queries run without any round trip
+Both answer the three thesis queries (I), (II) and (III); the in-memory engine only answers counting queries.
+'''
+
+# Schema of the generated UserData*.csv files
+personSchema = {"name": str, "gender": str, "age": int, "city": str, "income": float}
+
+# Stable query texts, values are always passed as parameters
+# $gen tags everything written after a snapshot with its load generation, null (not stored) before the first one
+insertPersonsQuery = "UNWIND $rows AS row CREATE (:Person { name: row.name, gender: row.gender, age: row.age, " \
+                     "city: row.city, income: row.income, _gen: $gen })"
+createNodesQuery = "UNWIND $rows AS row CREATE (n:{label}) SET n = row, n._gen = $gen"
+# Relationship builders look up both endpoint buckets on their own (index seeks) and join them in bounded batches,
+# instead of planning one Cartesian product MATCH (a: Person), (b: Person) over all Person pairs
+bucketQuery = "MATCH ({var}: Person) WHERE {condition} RETURN id({var}) AS id"
+joinBucketsQuery = "UNWIND $sources AS source MATCH (a) WHERE id(a) = source UNWIND $targets AS target " \
+                   "MATCH (b) WHERE id(b) = target CREATE (a)-[r:{relType} { _gen: $gen }]->(b) RETURN count(r)"
+degreeHistogramQuery = "MATCH (n) WITH size((n)--()) AS degree RETURN degree, count(*) AS nodes"
+# MATCH <pattern> [WHERE <condition>] RETURN count(<var>), the shape of the counting queries combined by countMany()
+countQueryPattern = re.compile(r"^\s*MATCH\s*(?P<pattern>.+?)\s*(?:\bWHERE\b\s*(?P<where>.+?))?\s*\bRETURN\s+count\s*"
+                               r"\(\s*[\w*]+\s*\)\s*(?:AS\s+\w+\s*)?;?\s*$", re.IGNORECASE | re.DOTALL)
+createIndexQuery = "CREATE INDEX ON :{label}({prop})"  # Neo4j 3.x syntax, a no-op if the index exists
+# Both counts are answered from Neo4j's count store
+nodeCountQuery = "MATCH (n) RETURN count(n) AS nodes"
+relationshipCountQuery = "MATCH ()-[r]->() RETURN count(r) AS relationships"
+clearQuery = "MATCH (n) WITH n LIMIT 10000 DETACH DELETE n RETURN count(n) AS deleted"
+# The highest generation stored in the graph, null if nothing is tagged
+storedGenerationQuery = "MATCH (n) WHERE exists(n._gen) RETURN max(n._gen) AS generation UNION ALL " \
+                        "MATCH ()-[r]->() WHERE exists(r._gen) RETURN max(r._gen) AS generation"
+deleteGenerationNodesQuery = "MATCH (n) WHERE n._gen >= $gen WITH n LIMIT 10000 DETACH DELETE n RETURN count(n)"
+deleteGenerationRelationshipsQuery = "MATCH ()-[r]->() WHERE r._gen >= $gen WITH r LIMIT 10000 DELETE r " \
+                                     "RETURN count(r)"
+
+
+class GraphBackend:
+    '''
+    Common interface of all graph backends. run() returns a list of records (dicts), like py2neo's .data().
+    Writes are reported to an attached statistics cache (stats.GraphStatistics), if there is one,
+    every statement text to an attached query translator (translator.QueryTranslator)
+    and every statement with its rows and duration to an attached tracer (tracing.Tracer).
+    Node rows are also written to an attached count cube (cube.CountCube), which answers the counting queries it
+    covers without a statement.
+    '''
+    name = "abstract"
+    stats = None
+    translator = None
+    tracer = None
+    cube = None
+
+    def __init__(self):
+        self.snapshots = 0  # sequence number of the last snapshot
+        self.liveSnapshots = []  # sequence numbers of the snapshots the graph still extends, see isLive()
+
+    def run(self, query, **params):
+        raise NotImplementedError
+
+    def connect(self):
+        # Opens the connection to the graph, backends without one have nothing to do
+        pass
+
+    def count(self, query, **params):
+        # The first value of the single record returned by a counting query
+        answer = self.cubeCount(query, params)
+        if answer is not None:
+            return answer
+        return next(iter(self.run(query, **params).pop().values()))
+
+    def cubeCount(self, query, params):
+        # Exact count from the attached count cube, None if there is none or it does not cover the query
+        if self.cube is None:
+            return None
+        return self.cube.count(query, params)
+
+    def countMany(self, queries):
+        # Counts of a batch of (query, params) pairs, backends answer queries sharing a pattern in one pass
+        return [self.count(query, **params) for query, params in queries]
+
+    def nodeCount(self):
+        raise NotImplementedError
+
+    def relationshipCount(self):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def createNodes(self, label, rows, schema=None):
+        raise NotImplementedError
+
+    def createPersons(self, rows):
+        raise NotImplementedError
+
+    def createRelationshipsByPrefix(self, prefixA, prefixB, relType):
+        raise NotImplementedError
+
+    def createRelationshipsBetween(self, conditionA, conditionB, relType, **params):
+        # Relationships from every Person a to every Person b matching the WHERE conditions on a and b
+        raise NotImplementedError
+
+    def propertyKeys(self):
+        # Names of all properties stored in the graph
+        raise NotImplementedError
+
+    def indexes(self):
+        # (label, property) of every existing single property index
+        raise NotImplementedError
+
+    def createIndex(self, label, prop):
+        raise NotImplementedError
+
+    def awaitIndexes(self):
+        # Blocks until all indexes are online
+        pass
+
+    def degreeHistogram(self):
+        # (degrees, nodes): how many nodes have each undirected degree
+        raise NotImplementedError
+
+    def snapshot(self):
+        # Marks the current graph as base, returns a token for restore()
+        raise NotImplementedError
+
+    def restore(self, token):
+        # Removes everything written since snapshot() returned token
+        raise NotImplementedError
+
+    def isLive(self, token):
+        '''
+        True if the graph consists of the snapshot of token plus later writes. A snapshot is no longer live once
+        the graph was cleared or an older snapshot was restored: its writes are gone and newer ones may take
+        their place, so removing everything written after it would not bring its graph back.
+        '''
+        return token.get("sequence") in self.liveSnapshots
+
+    def statementSent(self, text):
+        if self.translator is not None:
+            self.translator.statementSent(text)
+
+    def statementRan(self, text, rows, start):
+        # start is the time.perf_counter() value taken before the statement was sent
+        if self.tracer is not None:
+            self.tracer.statement(text, rows, time.perf_counter() - start)
+
+    def nodesAdded(self, label, count):
+        if self.stats is not None:
+            self.stats.nodesAdded(label, count)
+
+    def rowsAdded(self, label, rows):
+        # The property values of written nodes, nodesAdded() follows with their number
+        if self.cube is not None:
+            self.cube.add(label, rows)
+
+    def relationshipsAdded(self, count):
+        if self.stats is not None:
+            self.stats.relationshipsAdded(count)
+
+    def changedExternally(self):
+        # Statements BEPIS cannot follow, e.g. typed by the user, leave the cached counts unknown
+        if self.stats is not None:
+            self.stats.invalidate()
+        if self.cube is not None:
+            self.cube.invalidate()
+
+    def cleared(self):
+        self.liveSnapshots = []
+        if self.stats is not None:
+            self.stats.invalidate()
+        if self.cube is not None:
+            self.cube.clear()
+
+    def snapshotted(self, token):
+        # Numbers the snapshot and records the snapshots it extends
+        self.snapshots += 1
+        token["sequence"] = self.snapshots
+        token["extends"] = tuple(self.liveSnapshots)
+        self.liveSnapshots.append(self.snapshots)
+        # A snapshot token keeps a copy of the count cube, which is small next to the graph
+        if self.cube is not None:
+            token["cube"] = self.cube.copy()
+        return token
+
+    def restored(self, token):
+        # The graph is the one of the snapshot again, so are its live snapshots
+        self.liveSnapshots = list(token["extends"]) + [token["sequence"]]
+        # The counts of a restored graph are the ones recorded with the snapshot
+        if self.stats is not None:
+            self.stats.invalidate()
+            self.stats.nodes = token["nodes"]
+            self.stats.relationships = token["relationships"]
+        if self.cube is not None:
+            if token.get("cube") is not None:
+                self.cube.restoreFrom(token["cube"])
+            else:
+                self.cube.invalidate()
+
+
+class Py2neoBackend(GraphBackend):
+    name = "neo4j"
+
+    def __init__(self, uri, user, password):
+        super().__init__()
+        self.uri = uri
+        self.user = user
+        self.password = password
+        self.graph = None  # connected on first use
+        self.generation = None  # load generation written as _gen, set by snapshot()
+        self.generationRead = False  # True once generation continues the generations stored in the graph
+        self.relationshipBatchSize = 100000  # relationships created per transaction
+
+    @property
+    def g(self):
+        if self.graph is None:
+            from py2neo import Graph  # https://py2neo.org/v4/
+            self.graph = Graph(uri=self.uri, user=self.user, password=self.password)
+        return self.graph
+
+    def connect(self):
+        # Opens the Bolt connection now instead of on the first statement
+        self.run("RETURN 1 AS connected")
+
+    def run(self, query, **params):
+        self.statementSent(query)
+        start = time.perf_counter()
+        records = self.g.run(query, **params).data()
+        self.statementRan(query, len(records), start)
+        return records
+
+    def nodeCount(self):
+        return self.run(nodeCountQuery)[0]["nodes"]
+
+    def relationshipCount(self):
+        return self.run(relationshipCountQuery)[0]["relationships"]
+
+    def clear(self):
+        # adapt LIMIT value of clearQuery if not enough memory
+        nodes = self.nodeCount()
+        while nodes > 0:
+            print("Deleting Nodes: " + str(nodes) + " and relations: " + str(self.relationshipCount()))
+            self.run(clearQuery)
+            nodes = self.nodeCount()
+        self.generation = None
+        self.generationRead = True  # nothing is stored anymore
+        self.cleared()
+
+    def loadCsv(self, source, lineLimit=None, skipLines=0, chunkSize=10000):
+        # Server side LOAD CSV, source is a UserData*.csv file in Neo4j's import folder
+        # The rows are committed every chunkSize rows, not in one transaction holding all of them
+        window = " WITH line SKIP " + str(int(skipLines)) if skipLines else ""
+        if lineLimit is not None:
+            window = (window or " WITH line") + " LIMIT " + str(int(lineLimit) - int(skipLines))
+        loaded = self.count("USING PERIODIC COMMIT " + str(int(chunkSize)) + " LOAD CSV WITH HEADERS FROM \"file:///" +
+                            source + "\" AS line" + window +
+                            " CREATE (n:Person { name: line.name, gender: line.gender, age: toInteger(line.age), "
+                            "city: line.city, income: toFloat(line.income), _gen: $gen }) RETURN count(n)",
+                            gen=self.generation)
+        if self.cube is not None:
+            self.cube.invalidate()  # the rows are read by Neo4j, not by BEPIS
+        self.nodesAdded("Person", loaded)
+        return loaded
+
+    def createNodes(self, label, rows, schema=None):
+        # Missing (None) values are not stored as properties by SET n = row
+        if not label.isidentifier():
+            raise ValueError("Invalid node label: " + label)
+        query = createNodesQuery.replace("{label}", label)
+        self.statementSent(query)
+        start = time.perf_counter()
+        tx = self.g.begin()
+        tx.run(query, rows=rows, gen=self.generation)
+        tx.commit()
+        self.statementRan(query, len(rows), start)
+        self.rowsAdded(label, rows)
+        self.nodesAdded(label, len(rows))
+
+    def createPersons(self, rows):
+        self.statementSent(insertPersonsQuery)
+        start = time.perf_counter()
+        tx = self.g.begin()
+        tx.run(insertPersonsQuery, rows=rows, gen=self.generation)
+        tx.commit()
+        self.statementRan(insertPersonsQuery, len(rows), start)
+        self.rowsAdded("Person", rows)
+        self.nodesAdded("Person", len(rows))
+
+    def createRelationshipsByPrefix(self, prefixA, prefixB, relType):
+        self.createRelationshipsBetween("a.name STARTS WITH $prefixA", "b.name STARTS WITH $prefixB", relType,
+                                        prefixA=prefixA, prefixB=prefixB)
+
+    def createRelationshipsBetween(self, conditionA, conditionB, relType, **params):
+        # Every transaction creates about relationshipBatchSize relationships, whatever the size of the product
+        sources = self.bucket("a", conditionA, params)
+        targets = self.bucket("b", conditionB, params)
+        query = joinBucketsQuery.replace("{relType}", relType)
+        step = max(1, self.relationshipBatchSize // max(len(targets), 1))
+        created = 0
+        for start in range(0, len(sources) if targets else 0, step):
+            self.statementSent(query)
+            sent = time.perf_counter()
+            tx = self.g.begin()
+            batchCreated = next(iter(tx.run(query, sources=sources[start:start + step], targets=targets,
+                                            gen=self.generation).data().pop().values()))
+            tx.commit()
+            self.statementRan(query, batchCreated, sent)
+            created += batchCreated
+        self.relationshipsAdded(created)
+
+    def countMany(self, queries):
+        '''
+        Counting queries with the same MATCH pattern are combined into one statement with a conditional sum per
+        query, so the pattern is matched once: MATCH (n) RETURN sum(CASE WHEN <where> THEN 1 ELSE 0 END) AS c0, ...
+        Parameters of the WHERE clauses are renamed per query ($p0 of the second query becomes $q1_p0). Parameters
+        inside the pattern, like {gender: $p0}, are shared by the whole statement, so only queries binding them to
+        the same values are combined.
+        '''
+        counts = [None] * len(queries)
+        groups = {}
+        for i, (query, params) in enumerate(queries):
+            counts[i] = self.cubeCount(query, params)
+            if counts[i] is not None:
+                continue
+            shape = countQueryPattern.match(query)
+            if shape is None:
+                counts[i] = self.count(query, **params)
+                continue
+            pattern = " ".join(shape.group("pattern").split())
+            try:
+                patternParams = tuple((name, params[name]) for name in sorted(set(re.findall(r"\$(\w+)", pattern))))
+                group = groups.setdefault((pattern, patternParams), [])
+            except (KeyError, TypeError):  # unbound or unhashable pattern parameters, left to the database
+                counts[i] = self.count(query, **params)
+                continue
+            group.append((i, shape.group("where"), params))
+        for (pattern, patternParams), members in groups.items():
+            columns = []
+            combinedParams = dict(patternParams)
+            for i, where, params in members:
+                prefix = "q" + str(i) + "_"
+                if where is None:
+                    columns.append("count(*) AS c" + str(i))
+                else:
+                    where = re.sub(r"\$(\w+)", lambda match: "$" + prefix + match.group(1), where)
+                    columns.append("sum(CASE WHEN " + where + " THEN 1 ELSE 0 END) AS c" + str(i))
+                combinedParams.update({prefix + name: value for name, value in params.items()})
+            record = self.run("MATCH " + pattern + " RETURN " + ", ".join(columns), **combinedParams).pop()
+            for i, _, _ in members:
+                counts[i] = record["c" + str(i)]
+        return counts
+
+    def bucket(self, var, condition, params):
+        # Ids of the Persons matching condition on var, answered by an index seek if the properties are indexed
+        query = bucketQuery.replace("{var}", var).replace("{condition}", condition)
+        return [record["id"] for record in self.run(query, **params)]
+
+    def propertyKeys(self):
+        return {record["propertyKey"] for record in self.run("CALL db.propertyKeys()")}
+
+    def indexes(self):
+        # db.indexes() names the label "label" in Neo4j 3.4 and "tokenNames" in 3.5
+        found = set()
+        for record in self.run("CALL db.indexes()"):
+            labels = record.get("tokenNames") or [record.get("label")]
+            properties = record.get("properties") or []
+            if len(labels) == 1 and len(properties) == 1:
+                found.add((labels[0], properties[0]))
+        return found
+
+    def createIndex(self, label, prop):
+        if not label.isidentifier() or not prop.isidentifier():
+            raise ValueError("Invalid index :" + label + "(" + prop + ")")
+        self.run(createIndexQuery.replace("{label}", label).replace("{prop}", prop))
+
+    def awaitIndexes(self, timeout=300):
+        self.run("CALL db.awaitIndexes($timeout)", timeout=timeout)
+
+    def degreeHistogram(self):
+        records = self.run(degreeHistogramQuery)
+        return np.array([record["degree"] for record in records], dtype=np.int64), \
+            np.array([record["nodes"] for record in records], dtype=np.int64)
+
+    def readGeneration(self):
+        '''
+        Continues the generations of the graph. A graph reused from an earlier run holds writes of its generations
+        that were kept, e.g. the relationships built after SchemaManager.provision() restored its snapshot; a new
+        snapshot must not take one of their numbers, or restoring it would delete them.
+        '''
+        stored = [record["generation"] for record in self.run(storedGenerationQuery)
+                  if record["generation"] is not None]
+        self.generation = max(stored + [self.generation or 0]) or None
+        self.generationRead = True
+
+    def snapshot(self):
+        # Nothing is copied: from now on every write is tagged with a new generation
+        if not self.generationRead:
+            self.readGeneration()
+        self.generation = (self.generation or 0) + 1
+        return self.snapshotted({"generation": self.generation, "nodes": self.nodeCount(),
+                                 "relationships": self.relationshipCount()})
+
+    def restore(self, token):
+        # Only the delta is deleted, relationships added between base nodes first, then the new nodes
+        if not self.isLive(token):
+            raise ValueError("The snapshot can no longer be restored, the graph was cleared or an older snapshot "
+                             "was restored since")
+        for query in (deleteGenerationRelationshipsQuery, deleteGenerationNodesQuery):
+            while self.count(query, gen=token["generation"]) > 0:
+                pass
+        self.generation = token["generation"]
+        self.restored(token)
+
+
+class GrowableArray:
+    '''
+    Append-only numpy array with amortised growth, the backing store of one column.
+    '''
+    def __init__(self, dtype, fill):
+        self.dtype = dtype
+        self.fill = fill
+        self.data = np.full(1024, fill, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.full(max(needed, 2 * len(self.data)), self.fill, dtype=self.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def padTo(self, size):
+        # Nodes created without this property keep the fill value (missing)
+        if size > self.size:
+            self.extend(np.full(size - self.size, self.fill, dtype=self.dtype))
+
+    def view(self):
+        return self.data[:self.size]
+
+    def truncate(self, size):
+        self.size = min(self.size, size)
+
+    def copy(self):
+        copied = GrowableArray(self.dtype, self.fill)
+        copied.data = self.data[:max(self.size, 1)].copy()
+        copied.size = self.size
+        return copied
+
+
+class NumericColumn:
+    # Missing values are NaN
+    kind = "numeric"
+
+    def __init__(self):
+        self.values = GrowableArray(np.float64, np.nan)
+
+    def truncate(self, size, dictionarySize=None):
+        self.values.truncate(size)
+
+    def copy(self):
+        copied = NumericColumn()
+        copied.values = self.values.copy()
+        return copied
+
+
+class StringColumn:
+    '''
+    Dictionary encoded string column (gender, city, name, ...). Missing values have the code -1.
+    prefix keeps the first character of every value, which answers single character STARTS WITH filters,
+    e.g. the name prefix buckets used by query (III) and the Friends / Foes relationships.
+    '''
+    kind = "string"
+
+    def __init__(self):
+        self.codes = GrowableArray(np.int32, -1)
+        self.prefix = GrowableArray(np.int32, -1)
+        self.dictionary = []
+        self.lookup = {}
+
+    def encode(self, values):
+        codes = np.empty(len(values), dtype=np.int32)
+        prefix = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                codes[i] = -1
+                prefix[i] = -1
+                continue
+            code = self.lookup.get(value)
+            if code is None:
+                code = len(self.dictionary)
+                self.lookup[value] = code
+                self.dictionary.append(value)
+            codes[i] = code
+            prefix[i] = ord(value[0]) if value else -1
+        self.codes.extend(codes)
+        self.prefix.extend(prefix)
+
+    def encodeRepeated(self, value, count):
+        # count times the same value, e.g. the label of a chunk of nodes or the type of new relationships
+        if count > 0:
+            self.encode([value])
+            self.codes.extend(np.repeat(self.codes.view()[-1:], count - 1))
+            self.prefix.extend(np.repeat(self.prefix.view()[-1:], count - 1))
+
+    def truncate(self, size, dictionarySize):
+        # Values first seen after the snapshot are dropped from the dictionary as well
+        self.codes.truncate(size)
+        self.prefix.truncate(size)
+        for value in self.dictionary[dictionarySize:]:
+            del self.lookup[value]
+        del self.dictionary[dictionarySize:]
+
+    def copy(self):
+        copied = StringColumn()
+        copied.codes = self.codes.copy()
+        copied.prefix = self.prefix.copy()
+        copied.dictionary = list(self.dictionary)
+        copied.lookup = dict(self.lookup)
+        return copied
+
+
+def threeValued(valid, condition):
+    # Three-valued logic of Cypher: (isTrue, isFalse), anything else is null
+    return valid & condition, valid & ~condition
+
+
+def compareValues(values, op, value):
+    if op == "=":
+        return values == value
+    if op == "<>":
+        return values != value
+    if op == "<":
+        return values < value
+    if op == ">":
+        return values > value
+    if op == "<=":
+        return values <= value
+    if op == ">=":
+        return values >= value
+    raise UnsupportedQuery("Unsupported operator " + op)
+
+
+def compareString(entry, op, value):
+    if op == "STARTS WITH":
+        return entry.startswith(value)
+    if op == "ENDS WITH":
+        return entry.endswith(value)
+    if op == "CONTAINS":
+        return value in entry
+    return bool(compareValues(entry, op, value))
+
+
+def conjuncts(expression):
+    # Top level AND operands of a WHERE clause
+    if expression is None:
+        return []
+    if expression[0] == "and":
+        return conjuncts(expression[1]) + conjuncts(expression[2])
+    return [expression]
+
+
+def kinds(expression):
+    if expression[0] in ("and", "or"):
+        return {expression[0]} | kinds(expression[1]) | kinds(expression[2])
+    if expression[0] == "not":
+        return {"not"} | kinds(expression[1])
+    return {expression[0]}
+
+
+def hasPattern(expression):
+    return expression is not None and "pattern" in kinds(expression)
+
+
+def variables(expression):
+    kind = expression[0]
+    if kind in ("and", "or"):
+        return variables(expression[1]) | variables(expression[2])
+    if kind == "not":
+        return variables(expression[1])
+    if kind == "cmp":
+        return {expression[1]}
+    return {var for var in (expression[1], expression[2], expression[4]) if var is not None}
+
+
+class InMemoryBackend(GraphBackend):
+    '''
+    In-process graph engine. Nodes are rows of a column store, relationships are kept as (source, target, type)
+    edge arrays, which patterns filter by the masks of their endpoints before they are expanded.
+    '''
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self.indexed = set()  # (label, property) pairs, kept like Neo4j's indexes when the graph is cleared
+        self.relationshipBatchSize = 1000000  # bounds the temporary arrays of a relationship join
+        self.clear()
+
+    def clear(self):
+        self.size = 0
+        self.labels = StringColumn()
+        self.columns = {}
+        self.relSource = GrowableArray(np.int64, -1)
+        self.relTarget = GrowableArray(np.int64, -1)
+        self.relTypes = StringColumn()
+        self.parsed = {}
+        self.cleared()
+
+    # --- Writes ---
+
+    def createNodes(self, label, rows, schema=None):
+        '''
+        Appends one node per row (dict). schema maps property names to Python types and fixes the column kind,
+        otherwise it is derived from the first value of the property.
+        '''
+        if not rows:
+            return
+        start = self.size
+        count = len(rows)
+        keys = set()
+        for row in rows:
+            keys.update(row.keys())
+        for key in keys:
+            values = [row.get(key) for row in rows]
+            column = self.columns.get(key)
+            if column is None:
+                kind = schema.get(key) if schema else None
+                if kind is None:
+                    sample = next((value for value in values if value is not None), None)
+                    kind = str if isinstance(sample, str) else float
+                column = StringColumn() if kind is str else NumericColumn()
+                self.columns[key] = column
+            if column.kind == "string":
+                column.codes.padTo(start)
+                column.prefix.padTo(start)
+                column.encode([None if value is None else str(value) for value in values])
+            else:
+                column.values.padTo(start)
+                try:
+                    column.values.extend([np.nan if value is None else float(value) for value in values])
+                except (TypeError, ValueError):
+                    raise ValueError("Property " + key + " holds non numeric values")
+        self.labels.encodeRepeated(label, count)
+        self.size = start + count
+        for column in self.columns.values():
+            if column.kind == "string":
+                column.codes.padTo(self.size)
+                column.prefix.padTo(self.size)
+            else:
+                column.values.padTo(self.size)
+        self.rowsAdded(label, rows)
+        self.nodesAdded(label, count)
+
+    def createPersons(self, rows):
+        self.createNodes("Person", rows, personSchema)
+
+    def createRelationships(self, sources, targets, relType):
+        sources = np.asarray(sources, dtype=np.int64)
+        self.relSource.extend(sources)
+        self.relTarget.extend(np.asarray(targets, dtype=np.int64))
+        self.relTypes.encodeRepeated(relType, len(sources))
+        self.relationshipsAdded(len(sources))
+
+    def createRelationshipsByPrefix(self, prefixA, prefixB, relType):
+        # Join of both name prefix buckets, as MATCH (a), (b) WHERE ... STARTS WITH ... CREATE
+        sources = np.flatnonzero(self.startsWithMask("name", prefixA) & self.labelMask("Person"))
+        targets = np.flatnonzero(self.startsWithMask("name", prefixB) & self.labelMask("Person"))
+        self.joinBuckets(sources, targets, relType)
+
+    def createRelationshipsBetween(self, conditionA, conditionB, relType, **params):
+        sources = self.matchNodes("MATCH (a: Person) WHERE " + conditionA + " RETURN count(a)", params)
+        targets = self.matchNodes("MATCH (b: Person) WHERE " + conditionB + " RETURN count(b)", params)
+        self.joinBuckets(sources, targets, relType)
+
+    def joinBuckets(self, sources, targets, relType):
+        # Relationships from every source to every target, created in batches of sources
+        step = max(1, self.relationshipBatchSize // max(len(targets), 1))
+        for start in range(0, len(sources) if len(targets) else 0, step):
+            batch = sources[start:start + step]
+            self.createRelationships(np.repeat(batch, len(targets)), np.tile(targets, len(batch)), relType)
+
+    # --- Snapshots ---
+
+    def snapshot(self):
+        '''
+        Clones the column store. As columns are append-only, restore() just truncates them to the recorded sizes
+        while the snapshot is live; otherwise the clone is copied back.
+        '''
+        state = (self.size, self.labels.copy(), {key: column.copy() for key, column in self.columns.items()},
+                 self.relSource.copy(), self.relTarget.copy(), self.relTypes.copy())
+        return self.snapshotted({"nodes": self.size, "relationships": self.relSource.size, "state": state})
+
+    def restore(self, token):
+        size, labels, columns, relSource, relTarget, relTypes = token["state"]
+        if self.isLive(token):
+            for key in list(self.columns):
+                if key not in columns:
+                    del self.columns[key]
+                else:
+                    self.columns[key].truncate(size, len(getattr(columns[key], "dictionary", [])))
+            self.labels.truncate(size, len(labels.dictionary))
+            self.relSource.truncate(relSource.size)
+            self.relTarget.truncate(relTarget.size)
+            self.relTypes.truncate(relSource.size, len(relTypes.dictionary))
+        else:
+            self.labels = labels.copy()
+            self.columns = {key: column.copy() for key, column in columns.items()}
+            self.relSource, self.relTarget, self.relTypes = relSource.copy(), relTarget.copy(), relTypes.copy()
+        self.size = size
+        self.restored(token)
+
+    # --- Statistics ---
+
+    def nodeCount(self):
+        return self.size
+
+    def relationshipCount(self):
+        return self.relSource.size
+
+    def propertyKeys(self):
+        return set(self.columns)
+
+    def indexes(self):
+        return set(self.indexed)
+
+    def createIndex(self, label, prop):
+        # Columns are scanned vectorised and names keep a prefix array, so an index is only recorded here
+        self.indexed.add((label, prop))
+
+    def degrees(self):
+        # Undirected degree of every node, self loops count twice as in Neo4j
+        return np.bincount(self.relSource.view(), minlength=self.size) + \
+            np.bincount(self.relTarget.view(), minlength=self.size)
+
+    def degreeHistogram(self):
+        nodes = np.bincount(self.degrees())
+        degrees = np.flatnonzero(nodes)
+        return degrees, nodes[degrees]
+
+    # --- Query evaluation ---
+
+    def parse(self, query):
+        parsed = self.parsed.get(query)
+        if parsed is None:
+            try:
+                parsed = parseCountQuery(query)
+            except UnsupportedQuery as error:
+                raise UnsupportedQuery("The in-memory backend only answers counting queries: " + str(error))
+            self.parsed[query] = parsed
+        return parsed
+
+    def run(self, query, **params):
+        self.statementSent(query)
+        start = time.perf_counter()
+        parsed = self.parse(query)
+        records = [{parsed.columnName: int(self.match(parsed, params)[1].sum())}]
+        self.statementRan(query, len(records), start)
+        return records
+
+    def countMany(self, queries):
+        '''
+        Queries with the same MATCH pattern share one binding of the pattern, each of them only evaluates its
+        WHERE clause on the bound columns. A query alone in its group keeps the predicate push down of run().
+        '''
+        counts = [None] * len(queries)
+        groups = {}
+        for i, (query, params) in enumerate(queries):
+            counts[i] = self.cubeCount(query, params)
+            if counts[i] is not None:
+                continue
+            self.statementSent(query)
+            parsed = self.parse(query)
+            groups.setdefault((tuple(parsed.nodes), parsed.rel), []).append((i, query, parsed, params))
+        for members in groups.values():
+            start = time.perf_counter()
+            if len(members) == 1:
+                i, _, parsed, params = members[0]
+                counts[i] = int(self.match(parsed, params)[1].sum())
+            elif members[0][2].rel is None and not any(hasPattern(parsed.where) for _, _, parsed, _ in members):
+                # Node counts filter the columns directly, bound to None as in match()
+                var, label = members[0][2].nodes[0]
+                labelMask = self.labelMask(label)
+                for i, _, parsed, params in members:
+                    matched = self.whereMask(parsed, conjuncts(parsed.where), {var: None}, self.size, params)
+                    counts[i] = int(np.count_nonzero(matched & labelMask))
+            else:
+                bound, rows = self.bindings(members[0][2], {})
+                for i, _, parsed, params in members:
+                    counts[i] = int(self.whereMask(parsed, conjuncts(parsed.where), bound, rows, params).sum())
+            self.statementRan("\n".join(query for _, query, _, _ in members), len(members), start)
+        return counts
+
+    def matchNodes(self, query, params):
+        # Ids of the nodes matched by a single node counting query
+        parsed = self.parse(query)
+        if parsed.rel is not None:
+            raise UnsupportedQuery("Only node patterns can be matched")
+        bound, matched = self.match(parsed, params)
+        return bound[parsed.nodes[0][0]][matched]
+
+    def labelMask(self, label, nodes=None):
+        codes = self.labels.codes.view()
+        if nodes is not None:
+            codes = codes[nodes]
+        if label is None:
+            return np.ones(len(codes), dtype=bool)
+        code = self.labels.lookup.get(label)
+        return codes == code if code is not None else np.zeros(len(codes), dtype=bool)
+
+    def startsWithMask(self, prop, prefix, nodes=None):
+        isTrue, _ = self.compareProperty(prop, "STARTS WITH", prefix, nodes)
+        return isTrue
+
+    def bindings(self, parsed, nodeMasks):
+        '''
+        All rows matched by the MATCH pattern whose nodes pass nodeMasks (variable -> mask over all nodes),
+        as a dict variable -> node or relationship ids. Relationships are filtered before they are expanded.
+        '''
+        if parsed.rel is None:
+            var, label = parsed.nodes[0]
+            nodes = np.flatnonzero(self.labelMask(label) & nodeMasks.get(var, True))
+            return {var: nodes}, len(nodes)
+
+        (leftVar, leftLabel), (rightVar, rightLabel) = parsed.nodes
+        relVar, relType, direction = parsed.rel
+        sources, targets = self.relSource.view(), self.relTarget.view()
+        leftMask = self.labelMask(leftLabel) & nodeMasks.get(leftVar, True)
+        rightMask = self.labelMask(rightLabel) & nodeMasks.get(rightVar, True)
+        typeMask = None
+        if relType is not None:
+            typeMask = self.relTypes.codes.view() == self.relTypes.lookup.get(relType, -2)
+
+        def oriented(left, right):
+            keep = leftMask[left] & rightMask[right]
+            if typeMask is not None:
+                keep &= typeMask
+            rels = np.flatnonzero(keep)
+            return left[rels], right[rels], rels
+
+        if direction == "->":
+            left, right, rels = oriented(sources, targets)
+        elif direction == "<-":
+            left, right, rels = oriented(targets, sources)
+        else:
+            # An undirected pattern matches every relationship once in each direction
+            forward, backward = oriented(sources, targets), oriented(targets, sources)
+            left, right, rels = (np.concatenate([a, b]) for a, b in zip(forward, backward))
+        return {leftVar: left, rightVar: right, relVar: rels}, len(rels)
+
+    def match(self, parsed, params):
+        '''
+        The bindings of the MATCH pattern and the mask of the rows passing the WHERE clause.
+        Conjuncts on a single node variable are evaluated once per node and pushed into the pattern, the rest
+        is evaluated on the remaining rows. A row passes if every conjunct is true.
+        '''
+        labels = dict(parsed.nodes)
+        nodeMasks = {}
+        remaining = []
+        for conjunct in conjuncts(parsed.where):
+            referenced = variables(conjunct)
+            var = next(iter(referenced)) if len(referenced) == 1 else None
+            if var in labels and not hasPattern(conjunct):
+                # bound to None: the predicate is evaluated on all nodes
+                isTrue, _ = self.predicate(conjunct, {var: None}, self.size, params)
+                nodeMasks[var] = nodeMasks.get(var, True) & isTrue
+            else:
+                remaining.append(conjunct)
+        bound, rows = self.bindings(parsed, nodeMasks)
+        return bound, self.whereMask(parsed, remaining, bound, rows, params)
+
+    def whereMask(self, parsed, conjunctList, bound, rows, params):
+        # Rows of the bindings for which every conjunct is true
+        matched = np.ones(rows, dtype=bool)
+        for conjunct in conjunctList:
+            matched &= self.predicate(conjunct, bound, rows, params)[0]
+        if parsed.countVar is not None and parsed.countVar not in bound:
+            raise UnsupportedQuery("Unknown variable in count(): " + parsed.countVar)
+        return matched
+
+    def predicate(self, expression, bound, rows, params):
+        kind = expression[0]
+        if kind == "and":
+            leftTrue, leftFalse = self.predicate(expression[1], bound, rows, params)
+            rightTrue, rightFalse = self.predicate(expression[2], bound, rows, params)
+            return leftTrue & rightTrue, leftFalse | rightFalse
+        if kind == "or":
+            leftTrue, leftFalse = self.predicate(expression[1], bound, rows, params)
+            rightTrue, rightFalse = self.predicate(expression[2], bound, rows, params)
+            return leftTrue | rightTrue, leftFalse & rightFalse
+        if kind == "not":
+            isTrue, isFalse = self.predicate(expression[1], bound, rows, params)
+            return isFalse, isTrue
+        if kind == "cmp":
+            _, var, prop, op, value = expression
+            if var not in bound:
+                raise UnsupportedQuery("Unknown variable in WHERE clause: " + var)
+            if isinstance(value, tuple):
+                value = params[value[1]]
+            return self.compareProperty(prop, op, value, bound[var])
+        if kind == "pattern":
+            condition = self.patternPredicate(expression, bound, rows)
+            return condition, ~condition
+        raise UnsupportedQuery("Unsupported predicate " + kind)
+
+    def compareProperty(self, prop, op, value, nodes=None):
+        if nodes is None:
+            nodes = slice(None)
+        column = self.columns.get(prop)
+        if column is None:
+            missing = np.zeros(self.size, dtype=bool)[nodes]
+            if op == "isnull":
+                return ~missing, missing
+            return missing, missing
+
+        if column.kind == "numeric":
+            values = column.values.view()[nodes]
+            valid = ~np.isnan(values)
+        else:
+            codes = column.codes.view()[nodes]
+            valid = codes >= 0
+
+        if op == "isnull":
+            return ~valid, valid
+        if op == "isnotnull":
+            return valid, ~valid
+        if value is None:
+            none = np.zeros(len(valid), dtype=bool)
+            return none, none
+
+        numericValue = isinstance(value, (int, float)) and not isinstance(value, bool)
+        if column.kind == "numeric":
+            if not numericValue or op in ("STARTS WITH", "ENDS WITH", "CONTAINS"):
+                return self.typeMismatch(op, valid)
+            with np.errstate(invalid="ignore"):
+                return threeValued(valid, compareValues(values, op, value))
+
+        if not isinstance(value, str):
+            return self.typeMismatch(op, valid)
+        if op == "=":
+            return threeValued(valid, codes == column.lookup.get(value, -2))
+        if op == "<>":
+            return threeValued(valid, codes != column.lookup.get(value, -2))
+        if op == "STARTS WITH" and len(value) == 1:
+            return threeValued(valid, column.prefix.view()[nodes] == ord(value))
+        # Evaluate the predicate once per distinct value, then gather by code
+        entries = np.fromiter((compareString(entry, op, value) for entry in column.dictionary), dtype=bool,
+                              count=len(column.dictionary))
+        return threeValued(valid, entries[np.where(valid, codes, 0)] if len(entries) else valid & False)
+
+    def typeMismatch(self, op, valid):
+        # Equality between different types is false, ordering comparisons are null
+        if op == "=":
+            return np.zeros(len(valid), dtype=bool), valid
+        if op == "<>":
+            return valid, np.zeros(len(valid), dtype=bool)
+        none = np.zeros(len(valid), dtype=bool)
+        return none, none
+
+    def patternPredicate(self, expression, bound, rows):
+        _, leftVar, relVar, relType, rightVar, direction = expression
+        sources, targets = self.relSource.view(), self.relTarget.view()
+        if relVar in bound:
+            # The relationship is already matched, only check that it connects both endpoints
+            rels = bound[relVar]
+            relSources, relTargets = sources[rels], targets[rels]
+            condition = np.ones(rows, dtype=bool)
+            if relType is not None:
+                condition &= self.relTypes.codes.view()[rels] == self.relTypes.lookup.get(relType, -2)
+            left = bound.get(leftVar)
+            right = bound.get(rightVar)
+            forward = np.ones(rows, dtype=bool)
+            backward = np.ones(rows, dtype=bool)
+            if left is not None:
+                forward &= relSources == left
+                backward &= relTargets == left
+            if right is not None:
+                forward &= relTargets == right
+                backward &= relSources == right
+            if direction == "->":
+                return condition & forward
+            if direction == "<-":
+                return condition & backward
+            return condition & (forward | backward)
+
+        # Existence check: is there any relationship between the bound endpoints?
+        keep = np.ones(len(sources), dtype=bool)
+        if relType is not None:
+            keep = self.relTypes.codes.view() == self.relTypes.lookup.get(relType, -2)
+        sources, targets = sources[keep], targets[keep]
+        if direction == "<-":
+            sources, targets = targets, sources
+        elif direction == "-":
+            sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+        left = bound.get(leftVar)
+        right = bound.get(rightVar)
+        if left is None and right is None:
+            return np.full(rows, len(sources) > 0)
+        if right is None:
+            return np.isin(left, sources)
+        if left is None:
+            return np.isin(right, targets)
+        return np.isin(left * (self.size + 1) + right, sources * (self.size + 1) + targets)
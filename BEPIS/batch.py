@@ -0,0 +1,75 @@
+import numpy as np
+
+from noise import VectorLaplaceMechanism
+from tracing import noSpan
+
+'''
+Batch answering of counting queries for BEPIS.
+A report of several counts (e.g. Persons by gender, by age band and by city) is answered as one private query:
+    - all true counts come from one pass over the graph per MATCH pattern (GraphBackend.countMany)
+    - noise is added to the whole vector at once, eps is split across the batch, or kept whole by the histogram
+      mechanism if the counts are disjoint (noise.VectorLaplaceMechanism)
+    - the privacy budget is debited once, with the cost int(s) of the most sensitive query
+partitionQueries() and bandQueries() build batches of disjoint counts over one property.
+answerBatch() is used by the query server (server.py), which debits the analyst's budget in between.
+'''
+
+
+def checkNames(prop, label):
+    # Both are written into the query text
+    if not prop.isidentifier() or not label.isidentifier():
+        raise ValueError("Invalid property " + prop + " or label " + label)
+
+
+def isNumber(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def partitionQueries(prop, values, label="Person"):
+    # One count per value of prop, disjoint as every node holds at most one value
+    checkNames(prop, label)
+    if not all(isinstance(value, str) or isNumber(value) for value in values):
+        raise ValueError("Partition values must be strings or numbers")
+    if len(set(values)) != len(values):
+        raise ValueError("Partition values must be distinct")
+    return ["MATCH (n:" + label + ") WHERE n." + prop + " = " + repr(value) + " RETURN count(n)" for value in values]
+
+
+def bandQueries(prop, edges, label="Person"):
+    # One count per band [edges[i], edges[i + 1]) of a numeric property, disjoint as well
+    checkNames(prop, label)
+    if not all(isNumber(edge) for edge in edges) or any(low >= high for low, high in zip(edges[:-1], edges[1:])):
+        raise ValueError("Band edges must be strictly increasing numbers")
+    return ["MATCH (n:" + label + ") WHERE n." + prop + " >= " + repr(low) + " AND n." + prop + " < " + repr(high) +
+            " RETURN count(n)" for low, high in zip(edges[:-1], edges[1:])]
+
+
+def batchCost(sensitivities):
+    return int(max(sensitivities))
+
+
+def noTrace(phase, **attributes):
+    return noSpan
+
+
+def answerBatch(counter, templates, eps, sensitivities, disjoint=False, seed=None, debit=None, tracer=None):
+    '''
+    Private answers of a batch of translated queries (translator.QueryTemplate), counted by counter, a graph
+    backend or its statistics cache (stats.GraphStatistics), with one sensitivity per query. debit(cost) is called
+    before anything is released, if it refuses the batch None is returned.
+    Returns the true counts, the rounded noisy answers, the sensitivities, the noise scales and the budget cost.
+    '''
+    span = tracer.span if tracer is not None else noTrace
+    with span("count", batch=len(templates)):
+        trueCounts = counter.countMany([(template.text, template.params) for template in templates])
+    cost = batchCost(sensitivities)
+    # The whole batch is one release, its budget is debited once
+    with span("budget", cost=cost):
+        debited = debit is None or debit(cost)
+    if not debited:
+        return None
+    with span("noise", batch=len(templates), disjoint=disjoint):
+        mechanism = VectorLaplaceMechanism(eps, sensitivities, disjoint, seed)
+        answers = np.round(mechanism.release(trueCounts)).astype(np.int64)
+    return {"trueCounts": trueCounts, "answers": answers.tolist(), "sensitivities": list(sensitivities),
+            "scales": mechanism.scales.tolist(), "cost": cost}
@@ -0,0 +1,155 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from kdistance import insertKDistantNodes
+from lifecycle import GraphLifecycle
+from noise import LaplaceMechanism
+from queries import addBackendArguments, backendFromArgs, datasetDir, parseList, relationshipsFor, sensitivityFor, \
+    thesisQueries
+from sensitivity import SensitivityEngine
+from stats import GraphStatistics
+from translator import QueryTranslator
+
+'''
+Reproducible benchmark suite for BEPIS, replacing the interactive Testing Phase of main.py.
+Named scenarios <query>-<plain|edp|kinsert>-<lines> run the thesis queries with and without EDP rewriting across graph
+sizes. Every scenario has warm-up runs, is timed with perf_counter_ns and reports p50 / p95 / p99 latencies.
+Results are written as JSON; given a baseline file of an earlier run, scenarios whose p50 got slower than the
+threshold allows are flagged as regressions (exit code 1).
+    plain   - the query as it is, like the blank query test
+    edp     - the private answer of main.py: sensitivity at distance k, true count and Laplace noise
+    kinsert - the same answer with the k-distant graph written: k synthetic neighbours are inserted in chunks
+              (kdistance.insertKDistantNodes), counted on and removed again by restoring a snapshot
+'''
+
+def percentiles(timesNs):
+    times = np.asarray(timesNs, dtype=np.float64) / 1e6  # milliseconds
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {"runs": len(times), "meanMs": times.mean(), "minMs": times.min(), "maxMs": times.max(),
+            "p50Ms": p50, "p95Ms": p95, "p99Ms": p99}
+
+
+def measure(function, runs, warmup):
+    for _ in range(warmup):
+        function()
+    timesNs = []
+    for _ in range(runs):
+        start = time.perf_counter_ns()
+        function()
+        timesNs.append(time.perf_counter_ns() - start)
+    return percentiles(timesNs)
+
+
+def runSuite(g, csvName, sizes, queryKeys, modes=("plain", "edp"), runs=50, warmup=5, k=1, eps=0.1, seed=None,
+             verbose=True):
+    stats = GraphStatistics(g)
+    engine = SensitivityEngine(stats)
+    translator = QueryTranslator()
+    g.translator = translator
+    lifecycle = GraphLifecycle(g, verbose=False)
+    mechanismSeed = np.random.default_rng(seed)
+    scenarios = {}
+
+    for size in sorted(sizes):
+        lifecycle.growTo(csvName, datasetDir, size)
+        for conditionA, conditionB, relType in relationshipsFor(csvName):
+            g.createRelationshipsBetween(conditionA, conditionB, relType)
+        originNodeCount = stats.nodeCount()
+        withRelationships = g.snapshot() if "kinsert" in modes else None
+
+        for key in queryKeys:
+            query = thesisQueries.get(key, key)
+            template = translator.translate(query)
+
+            def plain():
+                g.run(template.text, **template.params)
+
+            def edp():
+                # Every run counts on the graph again, instead of timing a lookup in the statistics cache
+                stats.invalidate()
+                kCount = engine.expectedCounts(template.text, [k], **template.params)[0]
+                s = sensitivityFor("1", originNodeCount, kCount)
+                LaplaceMechanism(eps, s, seed=mechanismSeed).release(stats.count(template.text, **template.params))
+
+            def kinsert():
+                insertKDistantNodes(g, k, query, verbose=False)
+                kCount = g.count(template.text, **template.params)
+                s = sensitivityFor("1", originNodeCount, kCount)
+                g.restore(withRelationships)
+                LaplaceMechanism(eps, s, seed=mechanismSeed).release(g.count(template.text, **template.params))
+
+            scenarioFunctions = {"plain": plain, "edp": edp, "kinsert": kinsert}
+            for mode in modes:
+                name = key + "-" + mode + "-" + str(size)
+                result = measure(scenarioFunctions[mode], runs, warmup)
+                result.update({"query": key, "mode": mode, "lines": size, "nodes": originNodeCount})
+                scenarios[name] = result
+                if verbose:
+                    print(name + ": p50 " + str(round(result["p50Ms"], 3)) + " ms, p95 " +
+                          str(round(result["p95Ms"], 3)) + " ms, p99 " + str(round(result["p99Ms"], 3)) + " ms")
+    return scenarios
+
+
+def compareToBaseline(scenarios, baseline, threshold):
+    # Scenarios whose p50 grew by more than threshold (fraction) compared to the baseline
+    regressions = {}
+    for name, result in scenarios.items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None or old["p50Ms"] <= 0:
+            continue
+        change = result["p50Ms"] / old["p50Ms"] - 1
+        result["baselineP50Ms"] = old["p50Ms"]
+        result["change"] = change
+        if change > threshold:
+            regressions[name] = change
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite of BEPIS")
+    parser.add_argument("--dataset", default="UserData2.csv", help="csv file in the Datasets folder")
+    parser.add_argument("--sizes", default="1000,5000,10000", help="line limits (graph sizes)")
+    parser.add_argument("--queries", default="1,2,3", help="1, 2, 3 for the thesis queries or Cypher queries")
+    parser.add_argument("--modes", default="plain,edp", help="plain, edp and / or kinsert")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument("--eps", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=None)
+    addBackendArguments(parser)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", default=None, help="JSON output of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    scenarios = runSuite(backendFromArgs(args), args.dataset, parseList(args.sizes, int), parseList(args.queries),
+                         parseList(args.modes), args.runs, args.warmup, args.k, args.eps, args.seed)
+    report = {"meta": {"dataset": args.dataset, "backend": args.backend, "runs": args.runs, "warmup": args.warmup,
+                       "k": args.k, "eps": args.eps, "python": platform.python_version(),
+                       "machine": platform.machine(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+              "scenarios": scenarios}
+
+    regressions = {}
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            regressions = compareToBaseline(scenarios, json.load(baselineFile), args.threshold)
+        report["regressions"] = regressions
+        for name, change in sorted(regressions.items()):
+            print("REGRESSION " + name + ": p50 " + str(round(100 * change, 1)) + "% slower than the baseline")
+        if not regressions:
+            print("No regressions compared to " + args.baseline)
+
+    with open(args.output, 'w') as outputFile:
+        json.dump(report, outputFile, indent=2, default=float)
+    print("Wrote " + str(len(scenarios)) + " scenarios into " + args.output)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from backend import InMemoryBackend
+from cube import CountCube
+
+'''
+Test graph shared by the test modules: the graph is built from plain Python lists of nodes and relationships, which
+are returned as well, so that counts can be checked by brute force.
+'''
+
+cities = ["Berlin", "Darmstadt", "Hamburg", None]
+relTypes = ["Friends", "Foes", "NameASenior"]
+
+
+def buildGraph(seed=7, persons=150, companies=10, relationships=400):
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(persons):
+        income = rng.choice([round(rng.uniform(1000, 9000), 2), rng.randrange(10, 90) * 100, None])
+        nodes.append({"label": "Person", "name": rng.choice("ABCDnp") + str(i),
+                      "gender": rng.choice(["Male", "Female", None]), "age": rng.choice([rng.randint(18, 70), None]),
+                      "city": rng.choice(cities), "income": income})
+    nodes += [{"label": "Company", "name": "Company" + str(i)} for i in range(companies)]
+    edges = [(rng.randrange(persons), rng.randrange(persons), rng.choice(relTypes)) for _ in range(relationships)]
+    edges += [(i, i, "NameASenior") for i in range(0, persons, 15)]  # self loops
+    g = InMemoryBackend()
+    g.cube = CountCube()
+    g.createPersons([{key: value for key, value in node.items() if key != "label"} for node in nodes[:persons]])
+    g.createNodes("Company", [{"name": node["name"]} for node in nodes[persons:]])
+    for source, target, relType in edges:
+        g.createRelationships([source], [target], relType)
+    return g, nodes, edges
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return buildGraph()
+
+
+def scan(g, query, **params):
+    # Count of the engine itself, without the count cube
+    cube, g.cube = g.cube, None
+    try:
+        return g.count(query, **params)
+    finally:
+        g.cube = cube
@@ -0,0 +1,328 @@
+import numpy as np
+
+from backend import compareString, compareValues
+from cypher import parseCountQuery, UnsupportedQuery
+
+'''
+Count cube of BEPIS: pre-aggregated counts of the Person nodes over gender x age x income x city.
+The cube is a dense numpy array of node counts with one axis per property:
+    dictionary dimensions (gender, city) - slot 0 holds missing values, then one slot per distinct value; a
+                                           dimension with more than maxValues values (e.g. the unique cities of
+                                           UserData*.csv) is collapsed into one slot and no longer filtered
+    numeric dimensions (age, income)     - slot 0 holds missing values, then two slots per bucket of width:
+                                           values exactly on the lower edge and values inside of the bucket
+Attached to a backend (g.cube = CountCube()), it is updated with every row written through the backend: csv
+ingestion and k-distance nodes. BEPIS only deletes nodes by clearing the graph, which empties the cube, or by
+restoring a snapshot, whose token holds a copy of the cube (a few hundred kB) that is put back.
+GraphBackend.count() answers a single node count, whose WHERE clause only compares cube properties, from the
+cube without a database round trip. Answers are exact: a comparison is only answered if it decides every
+non-empty slot, e.g. income < 3000 with buckets of 100, but not income < 3050, which falls back to the graph
+like any other query the cube cannot answer.
+'''
+
+defaultDimensions = [("gender", "dictionary", 16), ("age", "numeric", 1), ("income", "numeric", 100),
+                     ("city", "dictionary", 64)]
+
+
+class DictionaryDimension:
+    def __init__(self, prop, maxValues):
+        self.prop = prop
+        self.maxValues = maxValues
+        self.values = []
+        self.lookup = {}
+        self.collapsed = False
+
+    @property
+    def size(self):
+        return 1 if self.collapsed else 1 + len(self.values)
+
+    def encode(self, values):
+        # Slots of values, None if the dimension overflows and has to be collapsed
+        if self.collapsed:
+            return np.zeros(len(values), dtype=np.int64)
+        for value in set(values):
+            if value is not None and value not in self.lookup:
+                if len(self.values) == self.maxValues:
+                    return None
+                self.values.append(value)
+                self.lookup[value] = len(self.values)
+        lookup = self.lookup
+        return np.fromiter((0 if value is None else lookup[value] for value in values), dtype=np.int64,
+                           count=len(values))
+
+    def compare(self, op, value):
+        # (isTrue, isFalse) of every slot, None if the comparison cannot be answered exactly
+        if self.collapsed:
+            return None
+        missing = np.zeros(1, dtype=bool)
+        if op in ("isnull", "isnotnull"):
+            isNull = np.concatenate([~missing, np.zeros(len(self.values), dtype=bool)])
+            return (isNull, ~isNull) if op == "isnull" else (~isNull, isNull)
+        if not isinstance(value, str):
+            return None
+        isTrue = np.fromiter((compareString(entry, op, value) for entry in self.values), dtype=bool,
+                             count=len(self.values))
+        return np.concatenate([missing, isTrue]), np.concatenate([missing, ~isTrue])
+
+    def copy(self):
+        copied = DictionaryDimension(self.prop, self.maxValues)
+        copied.values = list(self.values)
+        copied.lookup = dict(self.lookup)
+        copied.collapsed = self.collapsed
+        return copied
+
+
+class NumericDimension:
+    def __init__(self, prop, width, maxBuckets=4096):
+        self.prop = prop
+        self.width = float(width)
+        self.maxBuckets = maxBuckets
+        self.first = 0  # bucket number of the first bucket
+        self.buckets = 0
+
+    @property
+    def size(self):
+        return 1 + 2 * self.buckets
+
+    def bucketsOf(self, values):
+        return np.floor(values / self.width)
+
+    def growth(self, values):
+        # Buckets to add before and after the current range to cover values, None if there would be too many
+        buckets = self.bucketsOf(values[~np.isnan(values)])
+        if len(buckets) == 0:
+            return 0, 0
+        low, high = int(buckets.min()), int(buckets.max())
+        if self.buckets == 0:
+            self.first = low
+            before, after = 0, high - low + 1
+        else:
+            before = max(0, self.first - low)
+            after = max(0, high - (self.first + self.buckets - 1))
+        if self.buckets + before + after > self.maxBuckets:
+            return None
+        return before, after
+
+    def encode(self, values):
+        slots = np.zeros(len(values), dtype=np.int64)
+        valid = ~np.isnan(values)
+        buckets = self.bucketsOf(values[valid])
+        onEdge = values[valid] == buckets * self.width
+        slots[valid] = 1 + 2 * (buckets.astype(np.int64) - self.first) + np.where(onEdge, 0, 1)
+        return slots
+
+    def compare(self, op, value):
+        if op in ("isnull", "isnotnull"):
+            isNull = np.zeros(self.size, dtype=bool)
+            isNull[0] = True
+            return (isNull, ~isNull) if op == "isnull" else (~isNull, isNull)
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            return None
+        edges = (self.first + np.arange(self.buckets)) * self.width
+        edgeTrue = compareValues(edges, op, value)
+        upper = edges + self.width
+        # Values inside of a bucket lie in (edge, edge + width)
+        if op in ("<", "<="):
+            insideTrue, insideFalse = upper <= value, edges >= value
+        elif op in (">", ">="):
+            insideTrue, insideFalse = edges >= value, upper <= value
+        elif op == "=":
+            insideTrue, insideFalse = np.zeros(self.buckets, dtype=bool), ~((edges < value) & (value < upper))
+        elif op == "<>":
+            insideTrue, insideFalse = ~((edges < value) & (value < upper)), np.zeros(self.buckets, dtype=bool)
+        else:
+            return None  # string operators on numbers
+        isTrue = np.zeros(self.size, dtype=bool)
+        isFalse = np.zeros(self.size, dtype=bool)
+        isTrue[1::2], isFalse[1::2] = edgeTrue, ~edgeTrue
+        isTrue[2::2], isFalse[2::2] = insideTrue, insideFalse
+        return isTrue, isFalse
+
+    def copy(self):
+        copied = NumericDimension(self.prop, self.width, self.maxBuckets)
+        copied.first = self.first
+        copied.buckets = self.buckets
+        return copied
+
+
+class CountCube:
+    def __init__(self, label="Person", dimensions=defaultDimensions, maxCells=2000000):
+        self.label = label
+        self.spec = dimensions
+        self.maxCells = maxCells
+        self.parsed = {}
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self.dimensions = [DictionaryDimension(prop, setting) if kind == "dictionary" else
+                           NumericDimension(prop, setting) for prop, kind, setting in self.spec]
+        self.axes = {dimension.prop: axis for axis, dimension in enumerate(self.dimensions)}
+        self.counts = np.zeros([dimension.size for dimension in self.dimensions], dtype=np.int64)
+        self.otherNodes = 0  # nodes with another label, only counted by MATCH (n) queries
+        self.valid = True
+
+    def invalidate(self):
+        # The graph changed without the cube, e.g. LOAD CSV or statements typed by the user, until clear()
+        self.valid = False
+
+    # --- Updates ---
+
+    def add(self, label, rows):
+        if not self.valid:
+            return
+        if label != self.label:
+            self.otherNodes += len(rows)
+            return
+        if not rows:
+            return
+        slots = []
+        for axis, dimension in enumerate(self.dimensions):
+            if isinstance(dimension, DictionaryDimension) and dimension.collapsed:
+                slots.append(np.zeros(len(rows), dtype=np.int64))
+                continue
+            values = [row.get(dimension.prop) for row in rows]
+            if isinstance(dimension, NumericDimension):
+                try:
+                    values = np.array(values, dtype=np.float64)  # None becomes NaN
+                except (TypeError, ValueError):
+                    self.invalidate()
+                    return
+                growth = dimension.growth(values)
+                if growth is None:
+                    self.invalidate()  # the range of the property is too wide for the cube
+                    return
+                self.growAxis(axis, dimension, *growth)
+                slots.append(dimension.encode(values))
+            else:
+                encoded = dimension.encode([None if value is None else str(value) for value in values])
+                if encoded is None:
+                    self.collapseAxis(axis, dimension)
+                    encoded = dimension.encode(values)
+                self.growAxis(axis, dimension, 0, 0)
+                slots.append(encoded)
+        if self.counts.size > self.maxCells:
+            self.invalidate()
+            return
+        cells = np.ravel_multi_index(slots, self.counts.shape)
+        self.counts += np.bincount(cells, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def growAxis(self, axis, dimension, before, after):
+        # The counts are only copied if the axis gets new slots
+        if isinstance(dimension, NumericDimension):
+            if before == 0 and after == 0:
+                return
+            dimension.first -= before if dimension.buckets else 0
+            dimension.buckets += before + after
+            parts = [np.take(self.counts, [0], axis=axis), self.zeros(axis, 2 * before),
+                     np.take(self.counts, range(1, self.counts.shape[axis]), axis=axis), self.zeros(axis, 2 * after)]
+            self.counts = np.concatenate(parts, axis=axis)
+        elif dimension.size > self.counts.shape[axis]:
+            self.counts = np.concatenate([self.counts, self.zeros(axis, dimension.size - self.counts.shape[axis])],
+                                         axis=axis)
+
+    def zeros(self, axis, size):
+        shape = list(self.counts.shape)
+        shape[axis] = size
+        return np.zeros(shape, dtype=np.int64)
+
+    def collapseAxis(self, axis, dimension):
+        dimension.collapsed = True
+        self.counts = self.counts.sum(axis=axis, keepdims=True)
+
+    def copy(self):
+        copied = CountCube(self.label, self.spec, self.maxCells)
+        copied.dimensions = [dimension.copy() for dimension in self.dimensions]
+        copied.counts = self.counts.copy()
+        copied.otherNodes = self.otherNodes
+        copied.valid = self.valid
+        return copied
+
+    def restoreFrom(self, other):
+        self.dimensions = [dimension.copy() for dimension in other.dimensions]
+        self.counts = other.counts.copy()
+        self.otherNodes = other.otherNodes
+        self.valid = other.valid
+
+    # --- Answers ---
+
+    def count(self, query, params):
+        '''
+        Exact answer of a counting query from the cube, None if the cube cannot answer it.
+        '''
+        answer = self.answer(query, params) if self.valid else None
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def answer(self, query, params):
+        if query not in self.parsed:
+            try:
+                self.parsed[query] = parseCountQuery(query)
+            except UnsupportedQuery:
+                self.parsed[query] = None
+        parsed = self.parsed[query]
+        if parsed is None or parsed.rel is not None:
+            return None
+        var, label = parsed.nodes[0]
+        if label is None and self.otherNodes != 0 or label not in (None, self.label):
+            return None
+        if parsed.countVar not in (None, var):
+            return None
+        if parsed.where is None:
+            return int(self.counts.sum())
+        decided = self.predicate(parsed.where, var, params)
+        if decided is None:
+            return None
+        # Cells where the WHERE clause is false or null are not counted
+        isTrue = decided[0]
+        return int(self.counts.sum(where=isTrue))
+
+    def predicate(self, expression, var, params):
+        kind = expression[0]
+        if kind in ("and", "or"):
+            left = self.predicate(expression[1], var, params)
+            right = self.predicate(expression[2], var, params)
+            if left is None or right is None:
+                return None
+            if kind == "and":
+                return left[0] & right[0], left[1] | right[1]
+            return left[0] | right[0], left[1] & right[1]
+        if kind == "not":
+            decided = self.predicate(expression[1], var, params)
+            return None if decided is None else (decided[1], decided[0])
+        if kind != "cmp":
+            return None
+        _, cmpVar, prop, op, value = expression
+        if cmpVar != var or prop not in self.axes:
+            return None
+        if isinstance(value, tuple):
+            if value[1] not in params:
+                return None
+            value = params[value[1]]
+        axis = self.axes[prop]
+        decided = self.dimensions[axis].compare(op, value)
+        if decided is None:
+            return None
+        isTrue, isFalse = decided
+        # Slots left undecided (inside of a bucket split by the value) must be empty
+        undecided = ~(isTrue | isFalse)
+        undecided[0] = False  # missing values are null for every comparison
+        if undecided.any():
+            marginal = self.counts.sum(axis=tuple(i for i in range(self.counts.ndim) if i != axis))
+            if marginal[undecided].any():
+                return None
+        shape = [1] * self.counts.ndim
+        shape[axis] = len(isTrue)
+        return isTrue.reshape(shape), isFalse.reshape(shape)
+
+    def hitRate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self):
+        print("Count cube: " + str(self.counts.size) + " cells, shape " + str(self.counts.shape) + ", " +
+              ("valid" if self.valid else "invalidated") + ", hit rate " + str(self.hitRate()))
@@ -0,0 +1,247 @@
+import re
+
+'''
+Minimal parser for the counting queries BEPIS works with, used by the in-memory graph engine.
+Supported: MATCH <node> or MATCH <node>-[rel]-<node> (directions -, ->, <-), an optional WHERE clause made of
+property comparisons (=, <>, <, >, <=, >=, STARTS WITH, ENDS WITH, CONTAINS, IS [NOT] NULL), relationship
+patterns, AND / OR / NOT and parentheses, followed by RETURN count(<var>) or count(*).
+
+Predicates are returned as nested tuples:
+    ("and", a, b), ("or", a, b), ("not", a)
+    ("cmp", var, prop, op, value)                  value is a literal or ("param", name)
+    ("pattern", leftVar, relVar, relType, rightVar, direction)
+'''
+
+tokenPattern = re.compile(r"""
+    \s*(?:
+      (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+     |(?P<number>\d+\.\d*|\.\d+|\d+)
+     |(?P<param>\$\w+)
+     |(?P<name>[A-Za-z_]\w*|`[^`]+`)
+     |(?P<op><>|<=|>=|!=|[=<>()\[\]:,.\-*])
+    )""", re.VERBOSE)
+
+keywords = {"MATCH", "WHERE", "RETURN", "AND", "OR", "NOT", "STARTS", "ENDS", "WITH", "CONTAINS", "IS", "NULL",
+            "AS", "COUNT", "TRUE", "FALSE"}
+
+comparisonOps = {"=", "<>", "!=", "<", ">", "<=", ">="}
+flippedOps = {"=": "=", "<>": "<>", "<": ">", ">": "<", "<=": ">=", ">=": "<="}
+
+
+class UnsupportedQuery(ValueError):
+    pass
+
+
+class CountQuery:
+    def __init__(self, nodes, rel, where, countVar, columnName):
+        self.nodes = nodes  # list of (var, label), one or two entries
+        self.rel = rel  # None or (var, type, direction), direction is "-", "->" or "<-"
+        self.where = where
+        self.countVar = countVar  # None for count(*)
+        self.columnName = columnName
+
+
+def tokenize(query):
+    tokens = []
+    position = 0
+    query = query.strip().rstrip(";")
+    while position < len(query):
+        match = tokenPattern.match(query, position)
+        if not match or match.end() == position:
+            if query[position:].strip() == "":
+                break
+            raise UnsupportedQuery("Cannot tokenize query near: " + query[position:position + 20])
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "string":
+            tokens.append(("literal", re.sub(r"\\(.)", r"\1", text[1:-1])))
+        elif kind == "number":
+            tokens.append(("literal", float(text) if "." in text else int(text)))
+        elif kind == "param":
+            tokens.append(("param", text[1:]))
+        elif kind == "name":
+            if text.upper() in keywords:
+                tokens.append(("kw", text.upper()))
+            else:
+                tokens.append(("name", text.strip("`")))
+        else:
+            tokens.append(("op", text))
+    return tokens
+
+
+class Parser:
+    def __init__(self, query):
+        self.tokens = tokenize(query)
+        self.position = 0
+        self.anonymous = 0
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.position += 1
+            return token
+        return None
+
+    def expect(self, kind, value=None):
+        token = self.accept(kind, value)
+        if token is None:
+            raise UnsupportedQuery("Expected " + str(value or kind) + " but found " + str(self.peek()[1]))
+        return token
+
+    def freshVar(self):
+        self.anonymous += 1
+        return "_anon" + str(self.anonymous)
+
+    def parseNode(self):
+        self.expect("op", "(")
+        var = self.accept("name")
+        var = var[1] if var else self.freshVar()
+        label = None
+        if self.accept("op", ":"):
+            label = self.expect("name")[1]
+        self.expect("op", ")")
+        return var, label
+
+    def parseRel(self):
+        # Already positioned after the leading "-" or "<-"
+        self.expect("op", "[")
+        var = self.accept("name")
+        var = var[1] if var else self.freshVar()
+        relType = None
+        if self.accept("op", ":"):
+            relType = self.expect("name")[1]
+        self.expect("op", "]")
+        self.expect("op", "-")
+        return var, relType
+
+    def parsePath(self):
+        left = self.parseNode()
+        if self.peek() == ("op", "<") and self.peek(1) == ("op", "-"):
+            self.position += 2
+            relVar, relType = self.parseRel()
+            direction = "<-"
+        elif self.accept("op", "-"):
+            relVar, relType = self.parseRel()
+            direction = "->" if self.accept("op", ">") else "-"
+        else:
+            return [left], None
+        right = self.parseNode()
+        return [left, right], (relVar, relType, direction)
+
+    def parseQuery(self):
+        self.expect("kw", "MATCH")
+        nodes, rel = self.parsePath()
+        if self.peek() == ("op", ","):
+            raise UnsupportedQuery("Only a single MATCH path is supported")
+        where = None
+        if self.accept("kw", "WHERE"):
+            where = self.parseOr()
+        self.expect("kw", "RETURN")
+        self.expect("kw", "COUNT")
+        self.expect("op", "(")
+        if self.accept("op", "*"):
+            countVar = None
+            columnName = "count(*)"
+        else:
+            countVar = self.expect("name")[1]
+            columnName = "count(" + countVar + ")"
+        self.expect("op", ")")
+        if self.accept("kw", "AS"):
+            columnName = self.expect("name")[1]
+        if self.position != len(self.tokens):
+            raise UnsupportedQuery("Unexpected input after RETURN clause: " + str(self.peek()[1]))
+        return CountQuery(nodes, rel, where, countVar, columnName)
+
+    def parseOr(self):
+        left = self.parseAnd()
+        while self.accept("kw", "OR"):
+            left = ("or", left, self.parseAnd())
+        return left
+
+    def parseAnd(self):
+        left = self.parseNot()
+        while self.accept("kw", "AND"):
+            left = ("and", left, self.parseNot())
+        return left
+
+    def parseNot(self):
+        if self.accept("kw", "NOT"):
+            return ("not", self.parseNot())
+        return self.parseAtom()
+
+    def isPatternAhead(self):
+        # "(n)-" or "(n)<-" starts a relationship pattern, everything else in brackets is a sub expression
+        if self.peek() != ("op", "("):
+            return False
+        offset = 1
+        if self.peek(offset)[0] == "name":
+            offset += 1
+        if self.peek(offset) == ("op", ":"):
+            offset += 2
+        return self.peek(offset) == ("op", ")") and self.peek(offset + 1) in (("op", "-"), ("op", "<"))
+
+    def parseAtom(self):
+        if self.isPatternAhead():
+            nodes, rel = self.parsePath()
+            if rel is None:
+                raise UnsupportedQuery("Node patterns are not supported as predicates")
+            return ("pattern", nodes[0][0], rel[0], rel[1], nodes[1][0], rel[2])
+        if self.accept("op", "("):
+            expression = self.parseOr()
+            self.expect("op", ")")
+            return expression
+        return self.parseComparison()
+
+    def parseOperand(self):
+        token = self.next()
+        if token[0] == "name":
+            self.expect("op", ".")
+            return ("prop", token[1], self.expect("name")[1])
+        if token[0] == "literal":
+            return ("value", token[1])
+        if token[0] == "param":
+            return ("value", ("param", token[1]))
+        if token == ("op", "-") and self.peek()[0] == "literal":
+            return ("value", -self.next()[1])
+        if token[0] == "kw" and token[1] in ("TRUE", "FALSE"):
+            return ("value", token[1] == "TRUE")
+        raise UnsupportedQuery("Unsupported operand: " + str(token[1]))
+
+    def parseComparison(self):
+        left = self.parseOperand()
+        if self.accept("kw", "IS"):
+            negate = self.accept("kw", "NOT") is not None
+            self.expect("kw", "NULL")
+            if left[0] != "prop":
+                raise UnsupportedQuery("IS NULL is only supported on properties")
+            return ("cmp", left[1], left[2], "isnotnull" if negate else "isnull", None)
+        token = self.peek()
+        if token[0] == "op" and token[1] in comparisonOps:
+            op = "<>" if self.next()[1] == "!=" else token[1]
+        elif self.accept("kw", "STARTS") or self.accept("kw", "ENDS"):
+            op = "STARTS WITH" if self.tokens[self.position - 1][1] == "STARTS" else "ENDS WITH"
+            self.expect("kw", "WITH")
+        elif self.accept("kw", "CONTAINS"):
+            op = "CONTAINS"
+        else:
+            raise UnsupportedQuery("Expected a comparison operator but found " + str(token[1]))
+        right = self.parseOperand()
+        if left[0] == "prop" and right[0] == "value":
+            return ("cmp", left[1], left[2], op, right[1])
+        if left[0] == "value" and right[0] == "prop" and op in flippedOps:
+            return ("cmp", right[1], right[2], flippedOps[op], left[1])
+        raise UnsupportedQuery("Only comparisons between a property and a value are supported")
+
+
+def parseCountQuery(query):
+    return Parser(query).parseQuery()
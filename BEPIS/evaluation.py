@@ -0,0 +1,125 @@
+import argparse
+import csv
+import time
+
+import numpy as np
+
+from lifecycle import GraphLifecycle
+from noise import LaplaceMechanism
+from queries import addBackendArguments, backendFromArgs, datasetDir, parseList, relationshipsFor, sensitivityFor, \
+    thesisQueries
+from sensitivity import SensitivityEngine
+from stats import GraphStatistics
+from translator import QueryTranslator
+
+'''
+Non-interactive privacy-utility evaluation of BEPIS.
+Replaces the manual utility test of main.py (one interactive session per row of EDP_Utility_k_match_n_return_count_n.csv)
+with a sweep over a grid of graph sizes, k, sensitivity modes, queries and eps:
+    - every true count is computed once per graph size, the counts on the k-distant graphs of all k follow from
+      it analytically (sensitivity.py), so no synthetic nodes are written
+    - the noisy answers of a grid point are drawn at once, trials samples per point
+    - absolute / relative errors and confidence intervals are written into one csv file with a header row
+Sensitivity modes as in main.py: 1 computes s = 1 + |original graph| / count(query on the k-distant graph),
+2 uses a custom value, 3 the default s = 1. Like in main.py, s is capped to [1, 10] (queries.sensitivityFor).
+'''
+
+resultColumns = ["dataset", "lines", "nodes", "relationships", "query", "k", "sensitivityMode", "s", "eps", "trials",
+                 "trueCount", "kCount", "meanAnswer", "answerLow", "answerHigh", "meanAbsError", "absErrorLow",
+                 "absErrorHigh", "medianAbsError", "meanRelError", "seconds"]
+
+
+def summarise(answers, trueCount):
+    '''
+    Error statistics of the noisy answers of one grid point. The answer interval holds 95% of the answers,
+    the absolute error interval is the 95% confidence interval of the mean absolute error.
+    '''
+    absErrors = np.abs(answers - trueCount)
+    meanAbsError = absErrors.mean()
+    halfWidth = 1.96 * absErrors.std(ddof=1) / np.sqrt(len(absErrors)) if len(absErrors) > 1 else 0.0
+    answerLow, answerHigh = np.percentile(answers, [2.5, 97.5])
+    return {"meanAnswer": answers.mean(), "answerLow": answerLow, "answerHigh": answerHigh,
+            "meanAbsError": meanAbsError, "absErrorLow": meanAbsError - halfWidth,
+            "absErrorHigh": meanAbsError + halfWidth, "medianAbsError": np.median(absErrors),
+            "meanRelError": meanAbsError / max(trueCount, 1)}
+
+
+def evaluateGrid(g, csvName, sizes, epsValues, kValues, modes, queryKeys, trials=1000, customSensitivity=2,
+                 seed=None, relationships=None, verbose=True):
+    '''
+    Runs the whole grid on the graph backend g and returns one result dict per grid point.
+    '''
+    if relationships is None:
+        relationships = relationshipsFor(csvName)
+    rng = np.random.default_rng(seed)
+    stats = GraphStatistics(g)
+    engine = SensitivityEngine(stats)
+    translator = QueryTranslator()
+    g.translator = translator
+    lifecycle = GraphLifecycle(g, verbose=False)
+    results = []
+
+    for size in sorted(sizes):
+        lifecycle.growTo(csvName, datasetDir, size)
+        for conditionA, conditionB, relType in relationships:
+            g.createRelationshipsBetween(conditionA, conditionB, relType)
+        originNodeCount = stats.nodeCount()
+        relationshipCount = stats.relationshipCount()
+
+        templates = {key: translator.translate(thesisQueries.get(key, key)) for key in queryKeys}
+        trueCounts = {key: stats.count(template.text, **template.params) for key, template in templates.items()}
+
+        for key, template in templates.items():
+            start = time.time()
+            # Counts on the k-distant graphs of all k at once
+            kCounts = engine.expectedCounts(template.text, kValues, **template.params)
+            for k, kCount in zip(kValues, kCounts):
+                for mode in modes:
+                    s = sensitivityFor(mode, originNodeCount, kCount, customSensitivity)
+                    for eps in epsValues:
+                        answers = LaplaceMechanism(eps, s, seed=rng).releaseMany(trueCounts[key], trials)
+                        row = {"dataset": csvName, "lines": size, "nodes": originNodeCount,
+                               "relationships": relationshipCount, "query": key, "k": k, "sensitivityMode": mode,
+                               "s": s, "eps": eps, "trials": trials, "trueCount": trueCounts[key], "kCount": kCount}
+                        row.update(summarise(answers, trueCounts[key]))
+                        row["seconds"] = time.time() - start
+                        results.append(row)
+        if verbose:
+            print("Evaluated " + str(size) + " lines: " + str(originNodeCount) + " nodes, " +
+                  str(relationshipCount) + " relationships")
+    return results
+
+
+def writeResults(results, path):
+    with open(path, 'w', newline='') as writeCSV:
+        csvW = csv.DictWriter(writeCSV, fieldnames=resultColumns)
+        csvW.writeheader()
+        csvW.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Privacy-utility evaluation of BEPIS over a parameter grid")
+    parser.add_argument("--dataset", default="UserData2.csv", help="csv file in the Datasets folder")
+    parser.add_argument("--sizes", default="1000,5000,10000", help="line limits (graph sizes)")
+    parser.add_argument("--eps", default="0.01,0.1,0.5,1", help="eps values")
+    parser.add_argument("--k", default="1,10,100,1000", help="distances k")
+    parser.add_argument("--modes", default="1,2,3", help="sensitivity modes: 1 computed, 2 custom, 3 default")
+    parser.add_argument("--queries", default="1,2,3", help="1, 2, 3 for the thesis queries or Cypher queries")
+    parser.add_argument("--trials", type=int, default=1000, help="noisy answers per grid point")
+    parser.add_argument("--sensitivity", type=float, default=2, help="custom sensitivity of mode 2")
+    parser.add_argument("--seed", type=int, default=None)
+    addBackendArguments(parser)
+    parser.add_argument("--output", default="EDP_Utility_grid.csv")
+    args = parser.parse_args()
+
+    start = time.time()
+    results = evaluateGrid(backendFromArgs(args), args.dataset, parseList(args.sizes, int), parseList(args.eps, float),
+                           parseList(args.k, int), parseList(args.modes), parseList(args.queries), args.trials,
+                           args.sensitivity, args.seed)
+    writeResults(results, args.output)
+    print("Wrote " + str(len(results)) + " grid points into " + args.output + " in " + str(time.time() - start) +
+          " seconds")
+
+
+if __name__ == "__main__":
+    main()
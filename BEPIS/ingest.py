@@ -0,0 +1,126 @@
+import csv
+import os
+import time
+from itertools import islice
+
+from backend import personSchema
+
+'''
+Client-side streaming CSV ingestion for BEPIS.
+A csv file is read in fixed-size chunks from a generator, typed by a declarative per-dataset schema and written
+through the backend: batched parameterised UNWIND writes for Neo4j, the column store for the in-memory engine.
+Only one chunk is held in memory at a time, so UserData3.csv (500.000 entries) loads completely.
+'''
+
+defaultChunkSize = 10000
+
+# Declarative loading schemes: node label, identifier column and the type of every column that is loaded
+schemas = {
+    # CSV Files generated with: http://www.convertcsv.com/generate-test-data.htm
+    "UserData": {"label": "Person", "id": "name", "columns": personSchema},
+    # Adult data set of the UCI machine learning repository, with an additional ssn column
+    "adult": {"label": "Person", "id": "ssn",
+              "columns": {"ssn": str, "age": int, "workclass": str, "fnlwgt": int, "education": str,
+                          "educationnum": int, "maritalstatus": str, "occupation": str, "relationship": str,
+                          "race": str, "sex": str, "capitalgain": int, "capitalloss": int, "hoursperweek": int,
+                          "nativecountry": str, "salaries": str}},
+}
+
+# Values that mark a missing entry, adult.csv uses "?"
+missingValues = {"", "?"}
+
+
+def schemaFor(csvName):
+    # UserData.csv, UserData2.csv and UserData3.csv share one scheme
+    base = os.path.splitext(os.path.basename(csvName))[0]
+    if base.startswith("UserData"):
+        return schemas["UserData"]
+    return schemas.get(base)
+
+
+def convert(value, kind):
+    if value is None:
+        return None
+    value = value.strip()
+    if value in missingValues:
+        return None
+    try:
+        if kind is int:
+            return int(float(value)) if "." in value else int(value)  # like toInteger()
+        return kind(value)
+    except ValueError:
+        return None
+
+
+def readChunks(path, schema, chunkSize=defaultChunkSize, lineLimit=None, skipLines=0):
+    '''
+    Generator over typed rows of a csv file, yielding lists of at most chunkSize dicts.
+    Only the lines skipLines up to lineLimit (exclusive) are read, rows without an identifier are skipped.
+    '''
+    columns = schema["columns"]
+    identifier = schema["id"]
+    chunk = []
+    with open(path, newline='') as readCSV:
+        reader = csv.reader(readCSV)
+        header = next(reader, [])
+        positions = [(key, header.index(key) if key in header else None, kind) for key, kind in columns.items()]
+        stop = int(lineLimit) if lineLimit is not None else None
+        # Skipped lines are only split by the csv reader, never typed
+        for line in islice(reader, skipLines, stop):
+            row = {key: convert(line[position], kind) if position is not None and position < len(line) else None
+                   for key, position, kind in positions}
+            if row[identifier] is None:
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunkSize:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingestCsv(g, path, schema, chunkSize=defaultChunkSize, lineLimit=None, verbose=True, skipLines=0):
+    '''
+    Streams the csv file at path into the graph backend g and returns the load statistics
+    (rows, chunks, seconds, rowsPerSecond).
+    '''
+    if chunkSize < 1:
+        raise ValueError("chunkSize must be at least 1")
+
+    start = time.time()
+    rows = 0
+    chunks = 0
+    for chunk in readChunks(path, schema, chunkSize, lineLimit, skipLines):
+        g.createNodes(schema["label"], chunk, schema["columns"])
+        rows += len(chunk)
+        chunks += 1
+        if verbose:
+            elapsed = time.time() - start
+            print("Loaded " + str(rows) + " rows (" + str(round(rows / elapsed if elapsed else 0)) + " rows/s)")
+    seconds = time.time() - start
+    stats = {"rows": rows, "chunks": chunks, "seconds": seconds, "rowsPerSecond": rows / seconds if seconds else 0}
+    if verbose:
+        print("Ingested " + str(rows) + " rows in " + str(seconds) + " seconds")
+    return stats
+
+
+def loadDataset(g, csvName, datasetDir, lineLimit=None, chunkSize=defaultChunkSize, verbose=True, skipLines=0):
+    '''
+    Loads csvName (the lines skipLines up to lineLimit) into g. Files with a loading scheme that exist in
+    datasetDir are streamed client side, otherwise Neo4j loads the file from its import folder with LOAD CSV
+    (UserData*.csv only), committing every chunkSize rows.
+    Returns the load statistics, or None if there is no loading scheme for the file.
+    '''
+    schema = schemaFor(csvName)
+    path = os.path.join(datasetDir, csvName)
+    if schema is not None and os.path.isfile(path):
+        return ingestCsv(g, path, schema, chunkSize, lineLimit, verbose, skipLines)
+    if schema is schemas["UserData"] and g.name == "neo4j":
+        start = time.time()
+        rows = g.loadCsv(csvName, lineLimit, skipLines, chunkSize)
+        return {"rows": rows, "chunks": -(-rows // chunkSize), "seconds": time.time() - start, "rowsPerSecond": None}
+    if schema is None:
+        print("There is no loading scheme specified for this csv file.")
+    else:
+        print("Could not find " + path)
+    return None
@@ -0,0 +1,119 @@
+from bisect import bisect_right
+from random import randint, uniform, random, choice
+import time
+
+'''
+k-distant graph generation for BEPIS.
+Instead of opening one transaction per synthetic Person, all k records are built in Python up front and
+inserted in chunks with a single parameterised UNWIND statement per chunk.
+'''
+
+defaultChunkSize = 1000
+
+# Distribution of the synthetic Persons, also used by the exact selectivity of sensitivity.py
+syntheticAges = (20, 80)  # uniform integers, both ends included
+syntheticIncomes = (1000.0, 9000.0)  # uniform, rounded to cents
+syntheticCity = "Springfield"
+
+
+def queryGender(userQuery):
+    # Same check as the interactive loop: "Female" has to be tested first, as it contains "male"
+    if "Female" in userQuery:
+        return "Female"
+    elif "Male" in userQuery:
+        return "Male"
+    return None
+
+
+class NameSampler:
+    '''
+    Draws names from the same distribution as names.get_full_name(), but reads each name list only once.
+    names.get_name() rescans the whole file for every single name, which dominates building k records.
+    '''
+    def __init__(self):
+        import names  # only needed when neighbours are generated
+        self.lists = {}
+        for key, filename in names.FILES.items():
+            nameList, cumulative = [], []
+            with open(filename) as nameFile:
+                for line in nameFile:
+                    name, _, cumulativeValue, _ = line.split()
+                    nameList.append(name.capitalize())
+                    cumulative.append(float(cumulativeValue))
+            self.lists[key] = (nameList, cumulative)
+
+    def getName(self, key):
+        nameList, cumulative = self.lists[key]
+        # names.get_name() returns the first name whose cumulative value exceeds random() * 90
+        position = bisect_right(cumulative, random() * 90)
+        return nameList[position] if position < len(nameList) else ""
+
+    def firstNameShares(self, gender=None):
+        # Probability of every first name getFullName(gender) starts with, "" for draws past the end of a list
+        keys = ["first:" + gender] if gender in ("male", "female") else ["first:male", "first:female"]
+        shares = {}
+        for key in keys:
+            nameList, cumulative = self.lists[key]
+            previous = 0.0
+            for name, value in zip(nameList, cumulative):
+                value = min(value, 90.0)
+                shares[name] = shares.get(name, 0.0) + (value - previous) / 90 / len(keys)
+                previous = value
+            shares[""] = shares.get("", 0.0) + (90.0 - previous) / 90 / len(keys)
+        return shares
+
+    def getFullName(self, gender=None):
+        if gender not in ("male", "female"):
+            gender = choice(("male", "female"))
+        return self.getName("first:" + gender) + " " + self.getName("last")
+
+
+nameSampler = None
+
+
+def getNameSampler():
+    global nameSampler
+    if nameSampler is None:
+        nameSampler = NameSampler()
+    return nameSampler
+
+
+def buildSyntheticPersons(k, userQuery=""):
+    sampler = getNameSampler()
+    gender = queryGender(userQuery)
+    nameGender = gender.lower() if gender else None
+    rows = []
+    for _ in range(int(k)):
+        rows.append({"name": sampler.getFullName(nameGender), "gender": gender, "age": randint(*syntheticAges),
+                     "city": syntheticCity, "income": round(uniform(*syntheticIncomes), 2)})
+    return rows
+
+
+def chunked(rows, chunkSize):
+    for start in range(0, len(rows), chunkSize):
+        yield rows[start:start + chunkSize]
+
+
+def insertKDistantNodes(g, k, userQuery="", chunkSize=defaultChunkSize, verbose=True):
+    '''
+    Adds k synthetic Person nodes to the graph backend g and returns the list of per-chunk insert times (seconds).
+    Building the records is measured separately from the database writes.
+    '''
+    if chunkSize < 1:
+        raise ValueError("chunkSize must be at least 1")
+
+    buildStart = time.time()
+    rows = buildSyntheticPersons(k, userQuery)
+    buildTime = time.time() - buildStart
+    if verbose:
+        print("Built " + str(len(rows)) + " synthetic nodes in " + str(buildTime))
+
+    chunkTimes = []
+    for chunk in chunked(rows, chunkSize):
+        chunkStart = time.time()
+        g.createPersons(chunk)  # one UNWIND transaction with a stable query text per chunk
+        chunkTimes.append(time.time() - chunkStart)
+        if verbose:
+            print("Inserted chunk of " + str(len(chunk)) + " nodes in " + str(chunkTimes[-1]))
+
+    return chunkTimes
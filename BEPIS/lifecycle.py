@@ -0,0 +1,137 @@
+import json
+import os
+import time
+
+from ingest import loadDataset
+
+'''
+Graph lifecycle management for BEPIS.
+A loaded base dataset is snapshotted once and restored cheaply afterwards, instead of wiping the graph with
+DETACH DELETE loops and loading it again for every experiment:
+    Neo4j     - writes after the snapshot are tagged with a load generation (_gen), restoring deletes only that delta
+    in-memory - the column store is cloned, restoring truncates the append-only columns
+All phases are timed, report() prints the collected timings.
+A loaded dataset is recorded with a fingerprint (csv file, line limit, node and relationship counts), so a later
+run can reuse a graph that still holds it instead of wiping and reloading it. Wiping the graph or changing it
+outside of BEPIS (changedExternally) drops the fingerprint, as such changes are not undone by restoring a snapshot
+and do not always change the counts, e.g. SET n.age = 0.
+'''
+
+defaultFingerprintPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".graphFingerprint.json")
+
+
+def datasetFingerprint(csvName, datasetDir, lineLimit):
+    # Identifies a load request, a changed csv file in the Datasets folder changes its size or modification time
+    fingerprint = {"dataset": csvName, "lineLimit": None if lineLimit is None else int(lineLimit)}
+    path = os.path.join(datasetDir, csvName)
+    if os.path.isfile(path):
+        status = os.stat(path)
+        fingerprint.update({"fileSize": status.st_size, "fileModified": status.st_mtime})
+    return fingerprint
+
+
+class GraphLifecycle:
+    def __init__(self, g, verbose=True, fingerprintPath=defaultFingerprintPath):
+        self.g = g
+        self.verbose = verbose
+        self.fingerprintPath = fingerprintPath
+        self.base = None  # snapshot token of the base dataset
+        self.baseLines = 0  # csv lines contained in the base
+        self.timings = {"wipe": [], "load": [], "snapshot": [], "reset": []}
+
+    def timed(self, phase, function, *args, **kwargs):
+        start = time.time()
+        result = function(*args, **kwargs)
+        self.timings[phase].append(time.time() - start)
+        if self.verbose:
+            print(phase.capitalize() + " took " + str(self.timings[phase][-1]) + " seconds")
+        return result
+
+    def wipe(self):
+        # Full DETACH DELETE, only needed if the base itself changes
+        self.timed("wipe", self.g.clear)
+        self.forget()
+        self.base = None
+        self.baseLines = 0
+
+    def snapshot(self):
+        self.base = self.timed("snapshot", self.g.snapshot)
+
+    def reset(self):
+        # Back to the base dataset, drops k-distant nodes and everything else written after the snapshot
+        if self.base is None:
+            self.wipe()
+        else:
+            self.timed("reset", self.g.restore, self.base)
+
+    def loadBase(self, csvName, datasetDir, lineLimit=None):
+        self.wipe()
+        loaded = self.timed("load", loadDataset, self.g, csvName, datasetDir, lineLimit, verbose=False)
+        self.baseLines = lineLimit
+        self.snapshot()
+        return loaded
+
+    def growTo(self, csvName, datasetDir, lineLimit):
+        '''
+        Makes the base contain the first lineLimit lines of the csv file. A growing base is restored and only the
+        missing lines are appended, a shrinking one is reloaded.
+        '''
+        if self.base is None or self.baseLines is None or lineLimit < self.baseLines:
+            return self.loadBase(csvName, datasetDir, lineLimit)
+        self.reset()
+        loaded = self.timed("load", loadDataset, self.g, csvName, datasetDir, lineLimit, verbose=False,
+                            skipLines=self.baseLines)
+        self.baseLines = lineLimit
+        self.snapshot()
+        return loaded
+
+    def graphKey(self):
+        # One recorded fingerprint per graph, e.g. "neo4j bolt://localhost:7687"
+        return (self.g.name + " " + getattr(self.g, "uri", "")).strip()
+
+    def readFingerprints(self):
+        try:
+            with open(self.fingerprintPath) as fingerprintFile:
+                return json.load(fingerprintFile)
+        except (OSError, ValueError):
+            return {}
+
+    def isLoaded(self, csvName, datasetDir, lineLimit):
+        '''
+        True if the graph still holds the dataset recorded by markLoaded(). Costs two count lookups, which Neo4j
+        answers from its count store.
+        '''
+        recorded = self.readFingerprints().get(self.graphKey())
+        if recorded is None or recorded["dataset"] != datasetFingerprint(csvName, datasetDir, lineLimit):
+            return False
+        return recorded["nodes"] == self.g.nodeCount() and recorded["relationships"] == self.g.relationshipCount()
+
+    def markLoaded(self, csvName, datasetDir, lineLimit):
+        fingerprints = self.readFingerprints()
+        fingerprints[self.graphKey()] = {"dataset": datasetFingerprint(csvName, datasetDir, lineLimit),
+                                         "nodes": self.g.nodeCount(), "relationships": self.g.relationshipCount()}
+        self.writeFingerprints(fingerprints)
+
+    def writeFingerprints(self, fingerprints):
+        try:
+            with open(self.fingerprintPath, 'w') as fingerprintFile:
+                json.dump(fingerprints, fingerprintFile, indent=2)
+        except OSError:
+            print("Could not record the loaded dataset in " + self.fingerprintPath)
+
+    def forget(self):
+        # The graph no longer holds the recorded dataset
+        fingerprints = self.readFingerprints()
+        if fingerprints.pop(self.graphKey(), None) is not None:
+            self.writeFingerprints(fingerprints)
+
+    def changedExternally(self):
+        # After statements typed by the user: caches are dropped and the graph is reloaded by the next run
+        self.g.changedExternally()
+        self.forget()
+
+    def report(self):
+        for phase, times in self.timings.items():
+            if times:
+                print(phase.capitalize() + ": " + str(len(times)) + " times, total " + str(sum(times)) +
+                      " seconds, average " + str(sum(times) / len(times)) + " seconds")
@@ -0,0 +1,76 @@
+import numpy as np
+
+'''
+Noise mechanisms for BEPIS.
+The Laplace noise of the sensitivity-based mechanism is sampled locally with a seedable numpy generator,
+so releasing a private answer only needs the true count from the graph and no further transactions.
+'''
+
+
+class LaplaceMechanism:
+    '''
+    Laplace mechanism with scale s / eps.
+    The thesis computes trueCount - (s/eps) * sign(u) * log(1 - 2|u|) with u uniform in [-0.5, 0.5), which is the
+    inverse CDF of Laplace(0, s/eps). numpy's laplace sampler draws from the same distribution, but never hits
+    the u = -0.5 corner case, for which the formula above evaluates log(0).
+    '''
+    def __init__(self, eps, sensitivity, seed=None):
+        if float(eps) <= 0:
+            raise ValueError("eps must be positive")
+        if float(sensitivity) <= 0:
+            raise ValueError("sensitivity must be positive")
+        self.eps = float(eps)
+        self.sensitivity = float(sensitivity)
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def scale(self):
+        return self.sensitivity / self.eps
+
+    def noise(self, size=None):
+        return self.rng.laplace(0.0, self.scale, size)
+
+    def release(self, trueCount):
+        # One noisy answer
+        return float(trueCount + self.noise())
+
+    def releaseMany(self, trueCount, size):
+        # size independent noisy answers of the same true count, e.g. for utility studies
+        return trueCount + self.noise(size)
+
+    def releaseBatch(self, trueCounts, trials=1):
+        '''
+        Noisy answers for a vector of true counts, returned with shape (len(trueCounts), trials).
+        Every answer gets its own noise draw with the scale of this mechanism.
+        '''
+        trueCounts = np.asarray(trueCounts, dtype=np.float64)
+        return trueCounts[:, None] + self.noise((len(trueCounts), int(trials)))
+
+
+class VectorLaplaceMechanism:
+    '''
+    Laplace mechanism for a batch of counting queries answered at once, with one sensitivity per query.
+    The batch as a whole is eps-differentially private:
+        disjoint=False - eps is split evenly across the n queries, every answer gets scale s_i * n / eps
+        disjoint=True  - histogram mechanism for counts over disjoint sets (e.g. counts by gender), a node changes
+                         at most one of them, so every answer keeps the full eps, scale s_i / eps
+    '''
+    def __init__(self, eps, sensitivities, disjoint=False, seed=None):
+        self.sensitivities = np.asarray(sensitivities, dtype=np.float64)
+        if float(eps) <= 0:
+            raise ValueError("eps must be positive")
+        if len(self.sensitivities) == 0 or np.any(self.sensitivities <= 0):
+            raise ValueError("every sensitivity must be positive")
+        self.eps = float(eps)
+        self.disjoint = disjoint
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def scales(self):
+        share = 1 if self.disjoint else len(self.sensitivities)
+        return self.sensitivities * share / self.eps
+
+    def release(self, trueCounts):
+        # One noisy answer per query, all drawn at once
+        trueCounts = np.asarray(trueCounts, dtype=np.float64)
+        return trueCounts + self.rng.laplace(0.0, self.scales)
@@ -0,0 +1,75 @@
+import os
+
+from backend import InMemoryBackend, Py2neoBackend
+
+'''
+Queries and relationships used in the thesis and its evaluation, and the settings shared by main.py and the
+scripts (benchmark.py, evaluation.py, server.py): the Datasets folder, the graph backends and the sensitivity rule.
+'''
+
+datasetDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Datasets")  # streamed client side
+
+# Query (I), (II), and (III) mentioned in thesis
+q1 = "MATCH(n) RETURN count(n)"
+q2 = "MATCH(n)-[r]-() RETURN count(r)"
+q3 = "MATCH (n: Person)-[r: NameASenior]-(p: Person) WHERE n.income>2000 AND p.income<3000 AND n.age>62" \
+     " AND p.age<66 AND NOT (n)-[r]-(n) AND (NOT p.name STARTS WITH 'n' OR NOT n.name STARTS WITH 'p') " \
+     "RETURN count(r)"
+
+thesisQueries = {"1": q1, "2": q2, "3": q3}
+
+# Relationships between Persons a and b, as (condition on a, condition on b, relationship type)
+friendsAndFoes = [("a.name STARTS WITH 'A'", "b.name STARTS WITH 'B'", "Friends"),
+                  ("a.name STARTS WITH 'C'", "b.name STARTS WITH 'D'", "Foes")]
+nameASenior = [("a.age > 63 AND a.name STARTS WITH 'A'", "b.age > 63", "NameASenior")]  # needed by query (III)
+
+
+def relationshipsFor(csvName):
+    '''
+    Relationships built after loading csvName. The Friends / Foes products are too large for UserData3.csv and
+    other big files (about 1e9 relationships for 500.000 Persons), which only get the relations of query (III).
+    '''
+    if csvName in ("UserData.csv", "UserData2.csv"):
+        return friendsAndFoes + nameASenior
+    return nameASenior
+
+
+# Sensitivity modes of main.py: 1 computes s, 2 uses a custom value, 3 the default s = 1
+maxSensitivity = 10
+
+
+def sensitivityFor(mode, originNodeCount=None, kCount=None, customSensitivity=None):
+    '''
+    Sensitivity s of a query, capped to [1, maxSensitivity]. Mode "1" computes s = 1 + |original graph| / count(query
+    on the k-distant graph), which grows without bound as the count goes to 0, so an empty count gets the cap.
+    '''
+    if mode == "1":
+        s = 1 + originNodeCount / kCount if kCount else maxSensitivity
+    elif mode == "2":
+        s = float(customSensitivity)
+    else:
+        s = 1
+    return min(max(s, 1), maxSensitivity)
+
+
+def parseList(text, kind=str):
+    # Comma separated command line values
+    return [kind(value) for value in text.split(",") if value]
+
+
+def addBackendArguments(parser):
+    parser.add_argument("--backend", choices=["memory", "neo4j"], default="memory")
+    parser.add_argument("--uri", default="bolt://localhost:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="snsnsn11")
+
+
+def openBackend(backendName, uri=None, user=None, password=None):
+    # The in-memory engine for "memory", Neo4j otherwise
+    if backendName == "memory":
+        return InMemoryBackend()
+    return Py2neoBackend(uri=uri, user=user, password=password)
+
+
+def backendFromArgs(args):
+    return openBackend(args.backend, args.uri, args.user, args.password)
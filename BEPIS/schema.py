@@ -0,0 +1,117 @@
+import time
+
+from cypher import parseCountQuery, UnsupportedQuery
+from queries import thesisQueries, friendsAndFoes, nameASenior
+
+'''
+Schema and index management for BEPIS.
+The registered queries and relationship builders are parsed to find the label properties they filter on, e.g.
+Person.income, Person.age and Person.name for query (III) and the NameASenior / Friends / Foes relationships.
+After a dataset is loaded, every such property stored in the graph gets an index, so range and STARTS WITH
+filters become index seeks instead of label scans, and the relationships are built. The relationship builders,
+the registered queries and the bucket lookups are timed on the graph with its relationships, before and after
+the indexes are created: the relationships are built once without the indexes and removed again by restoring a
+snapshot, then built for good with them.
+'''
+
+
+def filteredProperties(expression, labels, found):
+    # (label, property) of every comparison in a WHERE clause on a labelled variable
+    if expression is None:
+        return found
+    kind = expression[0]
+    if kind in ("and", "or"):
+        filteredProperties(expression[1], labels, found)
+        filteredProperties(expression[2], labels, found)
+    elif kind == "not":
+        filteredProperties(expression[1], labels, found)
+    elif kind == "cmp":
+        _, var, prop, op, _ = expression
+        if labels.get(var) is not None and op not in ("isnull", "isnotnull"):
+            found.add((labels[var], prop))
+    return found
+
+
+def bucketQueries(relationships):
+    # The endpoint lookups of the relationship builders, see backend.bucketQuery
+    lookups = []
+    for conditionA, conditionB, relType in relationships:
+        lookups.append(("MATCH (a: Person) WHERE " + conditionA + " RETURN count(a)", relType + " a"))
+        lookups.append(("MATCH (b: Person) WHERE " + conditionB + " RETURN count(b)", relType + " b"))
+    return lookups
+
+
+class SchemaManager:
+    def __init__(self, g, queries=None, relationships=None, verbose=True):
+        self.g = g
+        self.queries = list(thesisQueries.items()) if queries is None else list(queries)  # (name, query)
+        self.relationships = friendsAndFoes + nameASenior if relationships is None else relationships
+        self.verbose = verbose
+        self.created = []
+        self.indexSeconds = 0.0
+        self.relationshipSeconds = 0.0  # of the relationships kept in the graph
+        self.timings = {}  # name -> [seconds before, seconds after] the indexes were created
+
+    def measuredQueries(self):
+        return [(query, "query " + name) for name, query in self.queries] + bucketQueries(self.relationships)
+
+    def requiredIndexes(self):
+        required = set()
+        for query, _ in self.measuredQueries():
+            try:
+                parsed = parseCountQuery(query)
+            except UnsupportedQuery:
+                continue  # only properties of the supported counting queries are derived
+            filteredProperties(parsed.where, dict(parsed.nodes), required)
+        stored = self.g.propertyKeys()
+        return {(label, prop) for label, prop in required if prop in stored}
+
+    def timeQueries(self, phase):
+        for query, name in self.measuredQueries():
+            start = time.time()
+            try:
+                self.g.run(query)
+            except UnsupportedQuery:
+                continue
+            self.timings.setdefault(name, [None, None])[phase] = time.time() - start
+
+    def buildRelationships(self, phase):
+        start = time.time()
+        for conditionA, conditionB, relType in self.relationships:
+            relStart = time.time()
+            self.g.createRelationshipsBetween(conditionA, conditionB, relType)
+            self.timings.setdefault("relationships " + relType, [None, None])[phase] = time.time() - relStart
+        return time.time() - start
+
+    def provision(self, measure=True):
+        '''
+        Creates the missing indexes of the registered queries and builds the registered relationships,
+        returns the created (label, property) pairs.
+        '''
+        missing = sorted(self.requiredIndexes() - self.g.indexes())
+        if measure and missing:
+            withoutRelationships = self.g.snapshot()
+            self.buildRelationships(0)
+            self.timeQueries(0)
+            self.g.restore(withoutRelationships)
+        start = time.time()
+        for label, prop in missing:
+            self.g.createIndex(label, prop)
+        if missing:
+            self.g.awaitIndexes()
+        self.indexSeconds = time.time() - start
+        self.created.extend(missing)
+        self.relationshipSeconds = self.buildRelationships(1)
+        if measure:
+            self.timeQueries(1)
+        return missing
+
+    def report(self):
+        if not self.verbose:
+            return
+        print("Created indexes: " + (", ".join(":" + label + "(" + prop + ")" for label, prop in self.created) or
+                                     "none") + " in " + str(self.indexSeconds) + " seconds")
+        for name, (before, after) in self.timings.items():
+            if before is not None and after is not None:
+                print("Computation time of " + name + ": " + str(before) + " seconds without, " + str(after) +
+                      " seconds with indexes")
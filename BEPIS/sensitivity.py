@@ -0,0 +1,157 @@
+import itertools
+
+import numpy as np
+
+from backend import InMemoryBackend
+from cypher import parseCountQuery, UnsupportedQuery
+from kdistance import getNameSampler, queryGender, syntheticAges, syntheticCity, syntheticIncomes
+
+'''
+Sensitivity engine of BEPIS.
+The k-distant graph of a counting query is the loaded graph plus k synthetic Persons (kdistance.py). Instead of
+writing them into the graph, its count is derived analytically:
+    count_k = count + k * selectivity
+where selectivity is the probability of a synthetic Person to match the query. It is computed exactly once per
+query from the distribution the synthetic Persons are drawn from, and is 0 for relationship patterns, as
+synthetic Persons are isolated. From count_k follow, for a whole array of k at once,
+    local sensitivity    s_k = 1 + |original graph| / count_k, the sensitivity of main.py
+    elastic sensitivity  1 for node counts, (maximum degree + k) for relationship counts, doubled for undirected
+                         patterns that match every relationship in both directions
+    smooth bound         max over k of e^(-beta * k) * elastic sensitivity at distance k
+Query counts come from the statistics cache (stats.GraphStatistics), the degree histogram is cached per graph
+version, so the graph is never written and every k costs no further database query.
+'''
+
+
+def comparisons(predicate):
+    # The ("cmp", var, prop, op, value) leaves of a parsed WHERE clause
+    if predicate is None or predicate[0] == "pattern":
+        return []
+    if predicate[0] == "cmp":
+        return [predicate]
+    return [leaf for operand in predicate[1:] for leaf in comparisons(operand)]
+
+
+def propertyClasses(prop, compared, nameGender):
+    '''
+    (value, probability) of one synthetic value per class of values that the (op, value) comparisons of the
+    query cannot tell apart. Incomes are split at the compared numbers, the single cents between are ignored.
+    Names are only supported for STARTS WITH prefixes without a space, which depend on the first name alone.
+    '''
+    if prop == "age":
+        low, high = syntheticAges
+        return [(age, 1 / (high - low + 1)) for age in range(low, high + 1)]
+    if prop == "income":
+        low, high = syntheticIncomes
+        cuts = sorted({low, high} | {float(value) for _, value in compared if isinstance(value, (int, float)) and
+                                     not isinstance(value, bool) and low < value < high})
+        return [((a + b) / 2, (b - a) / (high - low)) for a, b in zip(cuts, cuts[1:])]
+    prefixes = [value for op, value in compared if op not in ("isnull", "isnotnull")]
+    if any(op not in ("STARTS WITH", "isnull", "isnotnull") for op, _ in compared) or \
+            any(not isinstance(prefix, str) or " " in prefix for prefix in prefixes):
+        raise UnsupportedQuery("Only name prefixes without a space are supported")
+    classes = {}
+    for firstName, share in getNameSampler().firstNameShares(nameGender).items():
+        key = tuple(firstName.startswith(prefix) for prefix in prefixes)
+        name, total = classes.get(key, (firstName + " ", 0.0))
+        classes[key] = (name, total + share)
+    return list(classes.values())
+
+
+class SensitivityEngine:
+    def __init__(self, stats):
+        self.stats = stats
+        self.selectivities = {}  # (query, params) -> share of synthetic Persons matching the query
+        self.histogram = None
+        self.histogramVersion = None
+
+    def selectivity(self, query, **params):
+        key = (query, tuple(sorted(params.items())))
+        if key not in self.selectivities:
+            self.selectivities[key] = self.estimateSelectivity(query, params)
+        return self.selectivities[key]
+
+    def estimateSelectivity(self, query, params):
+        '''
+        One synthetic Person per combination of the classes of the compared properties (propertyClasses) is
+        matched in a separate in-memory graph, the selectivity is the summed probability of the matched ones.
+        '''
+        try:
+            parsed = parseCountQuery(query)
+        except UnsupportedQuery:
+            return 0.0  # unknown: s of the loaded graph, the largest s_k
+        if parsed.rel is not None:
+            return 0.0  # synthetic Persons have no relationships
+        # The synthetic Persons depend on the query, like in main.py, whose values are parameters here
+        userQuery = " ".join([query] + [str(value) for value in params.values()])
+        gender = queryGender(userQuery)
+        compared = {}
+        for _, _, prop, op, value in comparisons(parsed.where):
+            if isinstance(value, tuple):
+                value = params.get(value[1])
+            if prop in ("age", "income", "name"):
+                compared.setdefault(prop, []).append((op, value))
+        try:
+            classes = [propertyClasses(prop, ops, gender.lower() if gender else None) for prop, ops in compared.items()]
+        except UnsupportedQuery:
+            return 0.0
+
+        rows, weights = [], []
+        for combination in itertools.product(*classes):
+            row = {"gender": gender, "city": syntheticCity}
+            row.update(zip(compared, (value for value, _ in combination)))
+            rows.append(row)
+            weights.append(np.prod([share for _, share in combination]))
+        persons = InMemoryBackend()
+        persons.createPersons(rows)
+        try:
+            matched = persons.matchNodes(query, params)
+        except UnsupportedQuery:
+            return 0.0
+        return float(np.sum(np.asarray(weights)[matched]))
+
+    def expectedCounts(self, query, kValues, **params):
+        kValues = np.asarray(kValues, dtype=np.float64)
+        return self.stats.count(query, **params) + kValues * self.selectivity(query, **params)
+
+    def localSensitivity(self, query, kValues, originNodeCount=None, **params):
+        # s_k = 1 + |original graph| / count_k, infinite for an empty answer
+        if originNodeCount is None:
+            originNodeCount = self.stats.nodeCount()
+        counts = self.expectedCounts(query, kValues, **params)
+        with np.errstate(divide="ignore"):
+            return 1 + originNodeCount / counts
+
+    def degreeHistogram(self):
+        if self.histogram is None or self.histogramVersion != self.stats.version:
+            self.histogram = self.stats.g.degreeHistogram()
+            self.histogramVersion = self.stats.version
+        return self.histogram
+
+    def maxDegree(self):
+        degrees, _ = self.degreeHistogram()
+        return int(degrees.max()) if len(degrees) else 0
+
+    def elasticSensitivity(self, query, kValues):
+        kValues = np.asarray(kValues, dtype=np.float64)
+        try:
+            parsed = parseCountQuery(query)
+        except UnsupportedQuery:
+            parsed = None
+        if parsed is not None and parsed.rel is None:
+            return np.ones(len(kValues))  # adding or removing one node changes a node count by at most 1
+        # A changed node adds or removes all of its relationships, at distance k its degree can have grown by k
+        rows = 1 if parsed is not None and parsed.rel[2] != "-" else 2
+        return rows * (self.maxDegree() + kValues)
+
+    def smoothSensitivity(self, query, beta, maxK=None):
+        '''
+        max over k = 0 .. maxK of e^(-beta * k) * elastic sensitivity at distance k. The elastic sensitivity grows
+        linearly in k, so the maximum is reached for k <= 1 / beta, the default maxK.
+        '''
+        if beta <= 0:
+            raise ValueError("beta must be positive")
+        if maxK is None:
+            maxK = int(np.ceil(1 / beta))
+        kValues = np.arange(maxK + 1)
+        return float(np.max(np.exp(-beta * kValues) * self.elasticSensitivity(query, kValues)))
@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import contextvars
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from batch import answerBatch, bandQueries, partitionQueries
+from cube import CountCube
+from ingest import loadDataset
+from noise import LaplaceMechanism
+from queries import addBackendArguments, datasetDir, openBackend, relationshipsFor, sensitivityFor, thesisQueries
+from tracing import Tracer
+from translator import QueryTranslator
+
+'''
+Concurrent privacy query server of BEPIS.
+A long-running asyncio service that answers counting queries of many analysts at once. Clients connect over TCP
+and send one JSON request per line, every response is one JSON line:
+    {"id": 1, "analyst": "alice", "dataset": "UserData2.csv", "query": "1", "eps": 0.1, "sensitivity": "2"}
+    -> {"id": 1, "ok": true, "answer": 10012, "remainingBudget": 8, "latencyMs": 0.4}
+    {"metrics": true} -> latency percentiles, queue depth, in-flight and rejected requests
+    {"budget": true, "analyst": "alice", "dataset": "UserData2.csv"} -> remaining budget
+    {"queries": ["1", "MATCH (n:Person) WHERE n.age > 60 RETURN count(n)"], "eps": 0.1}
+    -> {"ok": true, "answers": [10003, 2741], "remainingBudget": 9, ...}, a batch counted in one pass per pattern,
+       eps split across the batch, and debited once (see batch.py)
+    {"partition": {"property": "gender", "values": ["Male", "Female"]}} or
+    {"bands": {"property": "age", "edges": [18, 30, 50, 66]}}
+    -> a batch of disjoint counts built by the server itself, every count keeps the full eps
+Queries run in parallel on a pool of graph connections per dataset. Every (dataset, analyst) pair has its own
+privacy budget pb, debited atomically before an answer is released, so concurrent queries can never overspend it.
+As in main.py, eps is fixed (--eps, 0.1 by default), the cost of a query is int(s) and non-counting queries
+exhaust the budget. Requests may repeat eps, any other value is rejected, as the cost does not grow with eps.
+Responses only hold the noisy answers and the remaining budget. The sensitivity s must not depend on the data:
+"3" (the default) uses s = 1 and any other number sets s directly, capped to [1, 10]. Mode "1" of main.py,
+s = 1 + |graph| / count(query), is not offered, as an analyst could compute the true count back from s or from
+the budget it costs.
+Every request is traced (tracing.py) as a "request" span with "count", "noise" and "budget" phases, the metrics
+include their latency percentiles and --trace writes the trace events as JSON lines.
+'''
+
+class PrivacyBudget:
+    '''
+    Privacy budget of one analyst on one dataset. debit() checks and subtracts under a lock.
+    '''
+    def __init__(self, pb):
+        self.pb = pb
+        self.lock = threading.Lock()
+
+    def debit(self, cost):
+        with self.lock:
+            if cost > self.pb:
+                return False
+            self.pb -= cost
+            return True
+
+    def exhaust(self):
+        with self.lock:
+            self.pb = 0
+
+    def remaining(self):
+        with self.lock:
+            return self.pb
+
+
+class BudgetLedger:
+    def __init__(self, initialBudget):
+        self.initialBudget = initialBudget
+        self.budgets = {}
+        self.lock = threading.Lock()
+
+    def get(self, dataset, analyst):
+        with self.lock:
+            key = (dataset, analyst)
+            if key not in self.budgets:
+                self.budgets[key] = PrivacyBudget(self.initialBudget)
+            return self.budgets[key]
+
+
+class ConnectionPool:
+    '''
+    Graph connections of one dataset. Requests waiting for a free connection make up the queue depth.
+    '''
+    def __init__(self, backends):
+        self.connections = backends
+        self.backends = asyncio.Queue()
+        for g in backends:
+            self.backends.put_nowait(g)
+        self.size = len(backends)
+        self.waiting = 0
+
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            return await self.backends.get()
+        finally:
+            self.waiting -= 1
+
+    def release(self, g):
+        self.backends.put_nowait(g)
+
+
+class Metrics:
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)  # milliseconds of the last requests
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+        self.inFlight = 0
+        self.started = time.time()
+
+    def snapshot(self, pools):
+        result = {"requests": self.requests, "rejected": self.rejected, "errors": self.errors,
+                  "inFlight": self.inFlight, "uptimeSeconds": time.time() - self.started,
+                  "queueDepth": {name: pool.waiting for name, pool in pools.items()}}
+        if self.latencies:
+            p50, p95, p99 = np.percentile(np.asarray(self.latencies), [50, 95, 99])
+            result.update({"p50Ms": p50, "p95Ms": p95, "p99Ms": p99})
+        return result
+
+
+def requestSensitivity(choice):
+    # s of a request, chosen before anything is counted
+    if choice == "1":
+        raise ValueError("Sensitivity mode 1 depends on the data and is not offered, send 3 or a number")
+    return sensitivityFor("3") if choice == "3" else sensitivityFor("2", customSensitivity=choice)
+
+
+class PrivacyQueryServer:
+    def __init__(self, pools, initialBudget=10, workers=8, seed=None, tracer=None, eps=0.1):
+        self.pools = pools  # dataset name -> ConnectionPool
+        self.eps = eps
+        self.ledger = BudgetLedger(initialBudget)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.translator = QueryTranslator()
+        self.rng = np.random.default_rng(seed)  # only used on the event loop thread
+        self.metrics = Metrics()
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        for pool in pools.values():
+            for g in set(pool.connections):
+                g.tracer = self.tracer
+
+    async def answer(self, request):
+        dataset = request.get("dataset") or next(iter(self.pools))
+        pool = self.pools.get(dataset)
+        if pool is None:
+            raise ValueError("Unknown dataset " + str(dataset))
+        analyst = str(request.get("analyst", "anonymous"))
+        budget = self.ledger.get(dataset, analyst)
+        if request.get("budget"):
+            return {"ok": True, "remainingBudget": budget.remaining()}
+
+        eps = float(request.get("eps", self.eps))
+        if eps != self.eps:
+            raise ValueError("eps is fixed to " + str(self.eps) + " on this server")
+        if any(request.get(key) is not None for key in ("queries", "partition", "bands")):
+            return await self.answerBatch(request, pool, budget, eps)
+
+        query = str(request.get("query") or thesisQueries["1"])
+        query = thesisQueries.get(query, query)
+        # querying for unique identifiers is most sensitive and should never result in feasible output
+        if "count" not in query.lower():
+            budget.exhaust()
+            self.metrics.rejected += 1
+            return {"ok": False, "error": "Very sensitive, only counting queries are answered", "remainingBudget": 0}
+
+        s = requestSensitivity(str(request.get("sensitivity", "3")))
+        template = self.translator.translate(query)
+        with self.tracer.span("count", query=template.text):
+            g = await pool.acquire()
+            try:
+                loop = asyncio.get_running_loop()
+                # The executor thread runs in a copy of this context, so its statements end up in this span
+                count = partial(g.count, template.text, **template.params)
+                trueCount = await loop.run_in_executor(self.executor, contextvars.copy_context().run, count)
+            finally:
+                pool.release(g)
+
+        # Nothing is released unless the budget covers the query
+        with self.tracer.span("budget", analyst=analyst, cost=int(s)):
+            debited = budget.debit(int(s))
+        if not debited:
+            self.metrics.rejected += 1
+            return {"ok": False, "error": "Privacy budget exhausted", "remainingBudget": budget.remaining()}
+        with self.tracer.span("noise", s=s, eps=eps):
+            answer = round(LaplaceMechanism(eps, s, seed=self.rng).release(trueCount))
+        return {"ok": True, "answer": answer, "remainingBudget": budget.remaining()}
+
+    async def answerBatch(self, request, pool, budget, eps):
+        # Only batches built here are known to be disjoint, a client could repeat one query to average the noise
+        disjoint = request.get("partition") is not None or request.get("bands") is not None
+        if request.get("partition") is not None:
+            partition = request["partition"]
+            queries = partitionQueries(str(partition.get("property")), list(partition.get("values") or []))
+        elif request.get("bands") is not None:
+            bands = request["bands"]
+            queries = bandQueries(str(bands.get("property")), list(bands.get("edges") or []))
+        elif request.get("disjoint"):
+            raise ValueError("Disjoint batches are built by the server, send a partition or bands")
+        else:
+            queries = [thesisQueries.get(str(query), str(query)) for query in request["queries"]]
+        if not queries:
+            raise ValueError("Empty batch")
+        if any("count" not in query.lower() for query in queries):
+            budget.exhaust()
+            self.metrics.rejected += 1
+            return {"ok": False, "error": "Very sensitive, only counting queries are answered", "remainingBudget": 0}
+
+        sensitivities = [requestSensitivity(str(request.get("sensitivity", "3")))] * len(queries)
+        templates = [self.translator.translate(query) for query in queries]
+        seed = int(self.rng.integers(2 ** 63))  # the generator itself stays on the event loop thread
+        g = await pool.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            # Counting, debiting and the noise run in the executor, in a copy of this context like answer()
+            batch = partial(answerBatch, g, templates, eps, sensitivities, disjoint, seed, budget.debit, self.tracer)
+            result = await loop.run_in_executor(self.executor, contextvars.copy_context().run, batch)
+        finally:
+            pool.release(g)
+        if result is None:
+            self.metrics.rejected += 1
+            return {"ok": False, "error": "Privacy budget exhausted", "remainingBudget": budget.remaining()}
+        return {"ok": True, "answers": result["answers"], "remainingBudget": budget.remaining()}
+
+    async def handleRequest(self, line):
+        start = time.perf_counter()
+        self.metrics.requests += 1
+        self.metrics.inFlight += 1
+        request = {}
+        try:
+            request = json.loads(line)
+            if request.get("metrics"):
+                response = {"ok": True, "metrics": self.metrics.snapshot(self.pools)}
+                if self.tracer.enabled:
+                    response["metrics"]["phases"] = self.tracer.summary()
+            else:
+                with self.tracer.span("request", id=request.get("id")):
+                    response = await self.answer(request)
+        except Exception as error:
+            self.metrics.errors += 1
+            response = {"ok": False, "error": str(error)}
+        finally:
+            self.metrics.inFlight -= 1
+        latency = (time.perf_counter() - start) * 1000
+        self.metrics.latencies.append(latency)
+        response["latencyMs"] = latency
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        return response
+
+    async def handleClient(self, reader, writer):
+        # Requests of one client are answered concurrently, responses carry the id of their request
+        pending = set()
+
+        async def respond(line):
+            response = await self.handleRequest(line)
+            writer.write((json.dumps(response, default=float) + "\n").encode())
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(respond(line))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handleClient, host, port)
+        print("BEPIS privacy query server listening on " + host + ":" + str(port))
+        async with server:
+            await server.serve_forever()
+
+
+def buildPools(datasets, backendName, poolSize, uri, user, password, lineLimit=None, countCube=True):
+    if backendName != "memory" and len(datasets) > 1:
+        # All connections share one Neo4j database, loading a dataset would wipe the one before
+        raise ValueError("Neo4j serves one dataset, start a server per dataset")
+    pools = {}
+    for csvName in datasets:
+        if backendName == "memory":
+            # Reads of the in-memory engine do not block each other, all connections share one graph
+            g = openBackend(backendName)
+            backends = [g] * poolSize
+        else:
+            backends = [openBackend(backendName, uri, user, password) for _ in range(poolSize)]
+            g = backends[0]
+            g.clear()
+        if countCube:
+            # Filled while loading, one cube answers the covered counts of every connection of the pool
+            cube = CountCube()
+            for backend in backends:
+                backend.cube = cube
+        loadDataset(g, csvName, datasetDir, lineLimit, verbose=False)
+        for conditionA, conditionB, relType in relationshipsFor(csvName):
+            g.createRelationshipsBetween(conditionA, conditionB, relType)
+        pools[csvName] = ConnectionPool(backends)
+        print("Loaded " + csvName + ": " + str(g.nodeCount()) + " nodes, " + str(g.relationshipCount()) +
+              " relationships")
+    return pools
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent privacy query server of BEPIS")
+    parser.add_argument("--dataset", action="append", help="csv file in the Datasets folder, can be repeated")
+    parser.add_argument("--lines", type=int, default=None, help="line limit of every dataset")
+    parser.add_argument("--pool", type=int, default=4, help="graph connections per dataset")
+    parser.add_argument("--workers", type=int, default=8, help="threads running the queries")
+    parser.add_argument("--budget", type=float, default=10, help="privacy budget pb of every analyst")
+    parser.add_argument("--eps", type=float, default=0.1, help="eps of every answer, as in main.py")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--trace", default=None, help="JSON lines file receiving the trace events")
+    parser.add_argument("--no-tracing", action="store_true", help="switch the phase tracing off")
+    parser.add_argument("--no-cube", action="store_true", help="answer every count from the graph")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7475)
+    addBackendArguments(parser)
+    args = parser.parse_args()
+    if args.backend != "memory" and len(args.dataset or []) > 1:
+        parser.error("Neo4j serves one dataset, start a server per dataset")
+
+    pools = buildPools(args.dataset or ["UserData2.csv"], args.backend, args.pool, args.uri, args.user,
+                       args.password, args.lines, not args.no_cube)
+    tracer = Tracer(enabled=not args.no_tracing, exportPath=args.trace)
+    if args.eps <= 0:
+        parser.error("eps must be positive")
+    server = PrivacyQueryServer(pools, args.budget, args.workers, args.seed, tracer, args.eps)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Server stopped")
+    finally:
+        tracer.close()
+
+
+if __name__ == "__main__":
+    main()
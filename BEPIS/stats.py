@@ -0,0 +1,167 @@
+from collections import OrderedDict
+
+from cypher import parseCountQuery, tokenize, UnsupportedQuery
+
+'''
+Sensitivity and statistics cache for BEPIS.
+Node, relationship and query counts are cached per graph version. Writes done through the backend
+(k-distance generation, csv loading, relationship builders) report their deltas, so the counts are adjusted
+instead of recomputed, and cached query counts that cannot be affected by the write are carried over.
+Changes made outside of BEPIS (e.g. in the Neo4j Browser) are not seen, call invalidate() after them.
+'''
+
+
+def normaliseQuery(query):
+    '''
+    Canonical text of a query: keywords upper case, whitespace and optional spaces removed,
+    so "MATCH(n) RETURN count(n)" and "match (n)  return COUNT(n);" share one cache entry.
+    '''
+    try:
+        tokens = tokenize(query)
+    except UnsupportedQuery:
+        return " ".join(query.split())
+    parts = []
+    for kind, value in tokens:
+        if kind == "literal" and isinstance(value, str):
+            parts.append("'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'")
+        elif kind == "param":
+            parts.append("$" + value)
+        else:
+            parts.append(str(value))
+    return " ".join(parts)
+
+
+def hasPatternPredicate(expression):
+    if expression is None:
+        return False
+    if expression[0] == "pattern":
+        return True
+    if expression[0] in ("and", "or", "not"):
+        return any(hasPatternPredicate(part) for part in expression[1:])
+    return False
+
+
+class GraphStatistics:
+    '''
+    Cache of node / relationship counts and query counts of one graph backend, with LRU eviction.
+    Attaches itself to the backend, which reports its writes with nodesAdded() and relationshipsAdded().
+    '''
+    def __init__(self, g, maxEntries=256):
+        self.g = g
+        self.maxEntries = maxEntries
+        self.version = 0
+        self.nodes = None
+        self.relationships = None
+        self.counts = OrderedDict()  # (normalised query, params, version) -> count
+        self.parsed = {}
+        self.hits = 0
+        self.misses = 0
+        g.stats = self
+
+    def invalidate(self):
+        self.version += 1
+        self.nodes = None
+        self.relationships = None
+        self.counts.clear()
+
+    def nodeCount(self):
+        if self.nodes is None:
+            self.nodes = self.g.nodeCount()
+        return self.nodes
+
+    def relationshipCount(self):
+        if self.relationships is None:
+            self.relationships = self.g.relationshipCount()
+        return self.relationships
+
+    def key(self, query, params):
+        return normaliseQuery(query), tuple(sorted(params.items())), self.version
+
+    def count(self, query, **params):
+        key = self.key(query, params)
+        if key in self.counts:
+            self.hits += 1
+            self.counts.move_to_end(key)
+            return self.counts[key]
+        self.misses += 1
+        value = self.g.count(query, **params)
+        self.store(key, value)
+        return value
+
+    def countMany(self, queries):
+        # Counts of a batch of (query, params) pairs, the ones not cached are answered in one backend call
+        keys = [self.key(query, params) for query, params in queries]
+        counts = [self.counts.get(key) for key in keys]
+        missing = [i for i, value in enumerate(counts) if value is None]
+        for i, key in enumerate(keys):
+            if counts[i] is not None:
+                self.counts.move_to_end(key)
+        self.hits += len(queries) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            for i, value in zip(missing, self.g.countMany([queries[i] for i in missing])):
+                counts[i] = value
+                self.store(keys[i], value)
+        return counts
+
+    def store(self, key, value):
+        self.counts[key] = value
+        self.counts.move_to_end(key)
+        while len(self.counts) > self.maxEntries:
+            self.counts.popitem(last=False)
+
+    def sensitivity(self, query, originDBNodeCount, **params):
+        # s = 1 + |original graph| / count(query on the k-distant graph)
+        return 1 + originDBNodeCount / self.count(query, **params)
+
+    def parse(self, normalised):
+        if normalised not in self.parsed:
+            try:
+                self.parsed[normalised] = parseCountQuery(normalised)
+            except UnsupportedQuery:
+                self.parsed[normalised] = None
+        return self.parsed[normalised]
+
+    def advance(self, adjust):
+        '''
+        Moves to the next graph version. adjust(parsedQuery, count) returns the count on the new version,
+        or None if it cannot be derived from the old one.
+        '''
+        old = list(self.counts.items())
+        self.version += 1
+        self.counts.clear()
+        for (normalised, params, _), value in old:
+            parsed = self.parse(normalised)
+            newValue = adjust(parsed, value) if parsed is not None else None
+            if newValue is not None:
+                self.counts[(normalised, params, self.version)] = newValue
+
+    def nodesAdded(self, label, count):
+        # New nodes are created without relationships
+        if self.nodes is not None:
+            self.nodes += count
+
+        def adjust(parsed, value):
+            if parsed.rel is not None:
+                return value  # isolated nodes do not match a relationship pattern
+            nodeLabel = parsed.nodes[0][1]
+            if nodeLabel is not None and nodeLabel != label:
+                return value
+            if parsed.where is None:
+                return value + count
+            return None  # depends on the properties of the new nodes
+        self.advance(adjust)
+
+    def relationshipsAdded(self, count):
+        if self.relationships is not None:
+            self.relationships += count
+
+        def adjust(parsed, value):
+            if parsed.rel is None and not hasPatternPredicate(parsed.where):
+                return value  # node counts do not depend on relationships
+            return None
+        self.advance(adjust)
+
+    def hitRate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,354 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from backend import clearQuery, nodeCountQuery, Py2neoBackend, relationshipCountQuery, storedGenerationQuery
+from conftest import buildGraph, scan
+from cypher import UnsupportedQuery
+from ingest import readChunks, schemas
+from noise import VectorLaplaceMechanism
+from queries import q1, q2, q3, sensitivityFor
+from sensitivity import SensitivityEngine
+from stats import GraphStatistics
+from tracing import Tracer
+from translator import parameterise
+
+'''
+Tests of BEPIS: the in-memory engine is compared with brute force counts over plain Python lists of nodes and
+relationships (conftest.buildGraph). Run with python -m pytest.
+'''
+
+# --- Three-valued logic of Cypher, None is null ---
+
+
+def compare(value, op, literal):
+    if value is None:
+        return None
+    if op == "=":
+        return value == literal
+    if op == "<>":
+        return value != literal
+    if op == "<":
+        return value < literal
+    if op == "<=":
+        return value <= literal
+    if op == ">":
+        return value > literal
+    if op == ">=":
+        return value >= literal
+    if op == "startswith":
+        return value.startswith(literal)
+    raise ValueError(op)
+
+
+def both(a, b):
+    if a is False or b is False:
+        return False
+    return None if a is None or b is None else True
+
+
+def either(a, b):
+    if a is True or b is True:
+        return True
+    return None if a is None or b is None else False
+
+
+def negate(a):
+    return None if a is None else not a
+
+
+# --- Brute force relationship matches ---
+
+
+def oriented(edges, direction, relType=None):
+    # (left, right, edge id) of every match of (left)-[r]-(right), undirected patterns match both directions
+    rows = []
+    for rel, (source, target, edgeType) in enumerate(edges):
+        if relType is not None and edgeType != relType:
+            continue
+        if direction in ("->", "-"):
+            rows.append((source, target, rel))
+        if direction in ("<-", "-"):
+            rows.append((target, source, rel))
+    return rows
+
+
+def connected(edges, left, right, relType, direction):
+    return any(row[0] == left and row[1] == right for row in oriented(edges, direction, relType))
+
+
+class RecordingGraph:
+    '''
+    Stands in for the py2neo Graph of a Py2neoBackend, records the statements sent and answers them with
+    answer(query, params), a list of records.
+    '''
+    def __init__(self, answer):
+        self.answer = answer
+        self.statements = []
+
+    def run(self, query, **params):
+        self.statements.append((query, params))
+        records = self.answer(query, params)
+        return SimpleNamespace(data=lambda: records)
+
+
+def neo4jBackend(answer):
+    g = Py2neoBackend(uri=None, user=None, password=None)
+    g.graph = RecordingGraph(answer)
+    return g
+
+
+# --- Engine ---
+
+
+def testThesisQueriesMatchBruteForce(graph):
+    g, nodes, edges = graph
+    assert scan(g, q1) == len(nodes)
+    assert scan(g, q2) == 2 * len(edges)
+
+    def q3Row(n, r, p):
+        a, b = nodes[n], nodes[p]
+        condition = both(both(compare(a["income"], ">", 2000), compare(b["income"], "<", 3000)),
+                         both(compare(a["age"], ">", 62), compare(b["age"], "<", 66)))
+        selfLoop = edges[r][0] == n and edges[r][1] == n
+        names = either(negate(compare(b["name"], "startswith", "n")), negate(compare(a["name"], "startswith", "p")))
+        return both(both(condition, not selfLoop), names) is True
+
+    expected = sum(q3Row(n, r, p) for n, p, r in oriented(edges, "-", "NameASenior"))
+    assert expected > 0
+    assert scan(g, q3) == expected
+
+
+@pytest.mark.parametrize("direction", ["->", "<-", "-"])
+@pytest.mark.parametrize("relType", ["Friends", None])
+def testRelationshipPatternsMatchBruteForce(graph, direction, relType):
+    g, nodes, edges = graph
+    left, right = ("-", "->") if direction == "->" else ("<-", "-") if direction == "<-" else ("-", "-")
+    rel = "[r:" + relType + "]" if relType else "[r]"
+    query = "MATCH (a:Person)" + left + rel + right + "(b:Person) WHERE a.age > 30 AND b.gender = 'Male' " \
+            "RETURN count(r)"
+    expected = sum(compare(nodes[a]["age"], ">", 30) is True and nodes[b]["gender"] == "Male"
+                   for a, b, _ in oriented(edges, direction, relType))
+    assert scan(g, query) == expected
+
+
+def testPatternPredicatesMatchBruteForce(graph):
+    g, nodes, edges = graph
+    persons = [i for i, node in enumerate(nodes) if node["label"] == "Person"]
+    query = "MATCH (n:Person) WHERE (n)-[:Friends]->() RETURN count(n)"
+    assert scan(g, query) == sum(any(edge[0] == n and edge[2] == "Friends" for edge in edges) for n in persons)
+
+    query = "MATCH (a:Person)-[r]->(b:Person) WHERE NOT (b)-[:Foes]->(a) RETURN count(r)"
+    assert scan(g, query) == sum(not connected(edges, b, a, "Foes", "->") for a, b, _ in oriented(edges, "->"))
+
+    query = "MATCH (a)<-[r:Friends]-(b) WHERE (a)-[]-(b) OR a.age IS NULL RETURN count(*)"
+    expected = sum(connected(edges, a, b, None, "-") or nodes[a]["age"] is None
+                   for a, b, _ in oriented(edges, "<-", "Friends"))
+    assert scan(g, query) == expected
+
+
+def testCountManyMatchesSingleCounts(graph):
+    g, _, _ = graph
+    queries = [(q1, {}), (q2, {}), (q3, {}),
+               ("MATCH (n:Person) WHERE n.age > $age RETURN count(n)", {"age": 40}),
+               ("MATCH (n:Person) WHERE n.name STARTS WITH $prefix RETURN count(n)", {"prefix": "A"}),
+               ("MATCH (a:Person)-[r:Foes]->(b:Person) WHERE a.income < $income RETURN count(r)", {"income": 5000}),
+               ("MATCH (a:Person)-[r:Foes]->(b:Person) WHERE (b)-[:Friends]-(a) RETURN count(r)", {})]
+    cube, g.cube = g.cube, None
+    try:
+        assert g.countMany(queries) == [g.count(query, **params) for query, params in queries]
+    finally:
+        g.cube = cube
+    assert g.countMany(queries) == [scan(g, query, **params) for query, params in queries]
+
+
+def testNeo4jCountManyBindsPatternParameters():
+    def answer(query, params):
+        if "CASE" not in query:
+            return [{"count(n)": 7}]
+        return [{column: 10 * int(column[1:]) for column in re.findall(r"AS (c\d+)", query)}]
+    g = neo4jBackend(answer)
+    query = "MATCH (n:Person {gender: $p0}) WHERE n.age > $p1 RETURN count(n)"
+    queries = [(query, {"p0": "Female", "p1": 30}), (query, {"p0": "Male", "p1": 30}),
+               (query, {"p0": "Female", "p1": 60}), (query, {"p0": ["Male"], "p1": 30})]
+    assert g.countMany(queries) == [0, 10, 20, 7]
+    statements = g.graph.statements
+    assert len(statements) == 3  # both Female queries are combined, the unhashable list is counted alone
+    assert statements[0] == (query, {"p0": ["Male"], "p1": 30})
+    assert statements[1][1] == {"p0": "Female", "q0_p1": 30, "q2_p1": 60, "q0_p0": "Female", "q2_p0": "Female"}
+    assert statements[2][1]["p0"] == "Male"
+
+
+def testUnsupportedStatementsRaiseUnsupportedQuery(graph):
+    g, _, _ = graph
+    for statement in ["MATCH (n) SET n.age = 1", "MATCH (n) RETURN count(DISTINCT n.city)",
+                      "MATCH (n) WHERE m.age > 1 RETURN count(n)", "MATCH (n) RETURN count(m)"]:
+        with pytest.raises(UnsupportedQuery):
+            scan(g, statement)
+
+
+def testNeo4jCountsAndWipesAreTraced():
+    nodes = [20000]
+
+    def answer(query, params):
+        if query == clearQuery:
+            nodes[0] -= 10000
+            return [{"deleted": 10000}]
+        return [{"nodes": nodes[0]}] if query == nodeCountQuery else [{"relationships": 5}]
+    g = neo4jBackend(answer)
+    g.tracer = Tracer()
+    with g.tracer.span("fingerprint"):
+        assert (g.nodeCount(), g.relationshipCount()) == (20000, 5)
+    with g.tracer.span("wipe"):
+        g.clear()
+    phases = g.tracer.summary()
+    assert phases["fingerprint"]["roundTrips"] == 2
+    assert phases["wipe"]["roundTrips"] == 7  # three node counts, two relationship counts, two deletes
+    texts = [event["statements"] for event in g.tracer.events if event["phase"] == "wipe"][0]
+    assert [statement["text"] for statement in texts].count(clearQuery) == 2
+    assert {query for query, _ in g.graph.statements} == {nodeCountQuery, relationshipCountQuery, clearQuery}
+
+
+def testNeo4jSnapshotsContinueTheStoredGenerations():
+    def answer(query, params):
+        if query == storedGenerationQuery:
+            return [{"generation": None}, {"generation": 1}]  # relationships kept by an earlier run
+        if query in (nodeCountQuery, relationshipCountQuery):
+            return [{"nodes": 10, "relationships": 4}]
+        return [{"count(n)": 0}]
+    g = neo4jBackend(answer)
+    token = g.snapshot()
+    assert token["generation"] == 2
+    g.restore(token)
+    deletes = [params["gen"] for query, params in g.graph.statements if "DELETE" in query]
+    assert deletes == [2, 2]
+    assert [query for query, _ in g.graph.statements].count(storedGenerationQuery) == 1
+    assert g.snapshot()["generation"] == 3
+
+    g = neo4jBackend(lambda query, params: [{"nodes": 0, "relationships": 0, "generation": None}])
+    g.clear()
+    assert g.snapshot()["generation"] == 1
+    assert storedGenerationQuery not in [query for query, _ in g.graph.statements]
+
+
+# --- Query translation ---
+
+
+def testParameteriseReplacesLiterals():
+    text, params = parameterise("match (n1:Person)  WHERE n1.name = 'O\\'Neil' AND "
+                                "n1.city <> \"Bad \\\"Kissingen\\\"\" AND n1.income >= 2500.5 AND n1.age < $age "
+                                "AND n1.age > 18 RETURN count(n1);")
+    assert text == "match (n1:Person) WHERE n1.name = $p0 AND n1.city <> $p1 AND n1.income >= $p2 AND " \
+                   "n1.age < $age AND n1.age > $p3 RETURN count(n1)"
+    assert params == {"p0": "O'Neil", "p1": 'Bad "Kissingen"', "p2": 2500.5, "p3": 18}
+    # Queries differing only in their values share one text
+    assert parameterise("MATCH (n) WHERE n.age > 30 RETURN count(n)")[0] == \
+        parameterise("MATCH (n) WHERE n.age > 63 RETURN count(n)")[0]
+
+
+def testParameteriseKeepsRelationshipLengths():
+    assert parameterise("MATCH (a)-[*2]-(b) RETURN count(b)") == ("MATCH (a)-[*2]-(b) RETURN count(b)", {})
+    text, params = parameterise("MATCH (a)-[r:Friends*1..3]->(b) WHERE a.age > 3 RETURN count(*)")
+    assert text == "MATCH (a)-[r:Friends*1..3]->(b) WHERE a.age > $p0 RETURN count(*)" and params == {"p0": 3}
+    assert parameterise("MATCH (a)-[*..5 {since: 2010}]-(b) RETURN count(b)") == \
+        ("MATCH (a)-[*..5 {since: $p0}]-(b) RETURN count(b)", {"p0": 2010})
+
+
+# --- Sensitivity ---
+
+
+def testSensitivityRuleIsCappedToOneAndTen():
+    assert sensitivityFor("1", 100, 50) == 3
+    assert sensitivityFor("1", 100, 5) == 10
+    assert sensitivityFor("1", 100, 0) == 10  # an empty count gets the cap
+    assert sensitivityFor("2", customSensitivity="0.5") == 1
+    assert sensitivityFor("2", customSensitivity=4.5) == 4.5
+    assert sensitivityFor("3") == 1
+
+
+def testSelectivityFollowsTheSyntheticDistribution():
+    engine = SensitivityEngine(None)
+    assert engine.selectivity("MATCH (n) RETURN count(n)") == 1
+    assert engine.selectivity("MATCH (n: Movie) RETURN count(n)") == 0
+    assert engine.selectivity("MATCH (n)-[r]->(m) RETURN count(r)") == 0
+    assert engine.selectivity("MATCH (n) WHERE n.age > $p0 RETURN count(n)", p0=60) == pytest.approx(20 / 61)
+    # Incomes are uniform in [1000, 9000], the gender is the one asked for
+    assert engine.selectivity("MATCH (n) WHERE n.income < 3000 AND n.gender = 'Female' RETURN count(n)") == \
+        pytest.approx(0.25)
+    assert engine.selectivity("MATCH (n) WHERE n.age <= 30 OR n.income >= 5000 RETURN count(n)") == \
+        pytest.approx(11 / 61 + 50 / 61 * 0.5)
+    prefix = engine.selectivity("MATCH (n) WHERE n.name STARTS WITH 'A' RETURN count(n)")
+    assert 0 < prefix < 1
+    assert engine.selectivity("MATCH (n) WHERE n.name STARTS WITH 'A' RETURN count(n)") == prefix
+
+
+# --- Noise ---
+
+
+def testBatchScalesSplitOrKeepTheBudget():
+    assert list(VectorLaplaceMechanism(0.5, [1, 2, 4]).scales) == [6, 12, 24]  # eps / 3 per query
+    assert list(VectorLaplaceMechanism(0.5, [1, 2, 4], disjoint=True).scales) == [2, 4, 8]
+    with pytest.raises(ValueError):
+        VectorLaplaceMechanism(0.5, [1, 0])
+
+
+# --- Statistics cache ---
+
+
+def testStatisticsCarryCountsOverWrites():
+    g, _, _ = buildGraph(seed=5)
+    g.cube = None
+    stats = GraphStatistics(g)
+    carried = {"MATCH (n) RETURN count(n)": True, "MATCH (n:Person) RETURN count(n)": True,
+               "MATCH (n:Company) RETURN count(n)": True, "MATCH (n:Person) WHERE n.age > 30 RETURN count(n)": False,
+               "MATCH (a)-[r]->(b) RETURN count(r)": True}
+    for query in carried:
+        stats.count(query)
+    assert (stats.nodeCount(), stats.relationshipCount()) == (160, 410)
+
+    g.createPersons([{"name": "k" + str(i), "age": 40 + i} for i in range(5)])
+    for query, kept in carried.items():
+        hits = stats.hits
+        assert stats.count(query) == g.count(query), query
+        assert stats.hits == hits + kept, query
+    assert (stats.nodeCount(), stats.relationshipCount()) == (165, 410)
+
+    # Node counts survive new relationships, unless they depend on relationship patterns
+    carried.update({"MATCH (n:Person) WHERE n.age > 30 RETURN count(n)": True,
+                    "MATCH (a)-[r]->(b) RETURN count(r)": False,
+                    "MATCH (n:Person) WHERE (n)-[:Friends]->() RETURN count(n)": False})
+    stats.count("MATCH (n:Person) WHERE (n)-[:Friends]->() RETURN count(n)")
+    g.createRelationships([0, 1, 150], [160, 161, 2], "Friends")
+    for query, kept in carried.items():
+        hits = stats.hits
+        assert stats.count(query) == g.count(query), query
+        assert stats.hits == hits + kept, query
+    assert (stats.nodeCount(), stats.relationshipCount()) == (165, 413)
+
+
+# --- Ingestion ---
+
+
+def testReadChunksSkipsAndLimitsLines(tmp_path):
+    path = tmp_path / "UserData.csv"
+    lines = ["name,gender,age,city,income"]
+    lines += ["P" + str(i) + ",Male," + str(20 + i) + ",Berlin," + str(1000 + i) + ".5" for i in range(10)]
+    lines[4] = ",Female,30,Hamburg,2000"  # no identifier, skipped
+    path.write_text("\n".join(lines) + "\n")
+    schema = schemas["UserData"]
+    chunks = list(readChunks(str(path), schema, chunkSize=2, lineLimit=7, skipLines=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2]
+    rows = [row for chunk in chunks for row in chunk]
+    assert [row["name"] for row in rows] == ["P2", "P4", "P5", "P6"]
+    assert rows[0] == {"name": "P2", "gender": "Male", "age": 22, "city": "Berlin", "income": 1002.5}
+    assert sum(len(chunk) for chunk in readChunks(str(path), schema, chunkSize=4)) == 9
+    assert list(readChunks(str(path), schema, lineLimit=3, skipLines=3)) == []
+
+
+def testServerSideLoadCommitsPeriodically():
+    g = neo4jBackend(lambda query, params: [{"count(n)": 5}])
+    assert g.loadCsv("UserData3.csv", lineLimit=15, skipLines=10, chunkSize=1000) == 5
+    statement, _ = g.graph.statements[-1]
+    assert statement.startswith("USING PERIODIC COMMIT 1000 LOAD CSV")
+    assert "WITH line SKIP 10 LIMIT 5 CREATE" in statement
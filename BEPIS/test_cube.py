@@ -0,0 +1,75 @@
+import random
+
+from conftest import buildGraph, cities, scan
+from queries import q1
+
+'''
+Tests of the count cube: its answers are compared with the counts of the in-memory engine itself on random
+predicates, also after writes and restores.
+'''
+
+
+def randomPredicate(rng, depth=0):
+    if depth < 2 and rng.random() < 0.5:
+        kind = rng.choice(["AND", "OR", "NOT"])
+        if kind == "NOT":
+            return "NOT (" + randomPredicate(rng, depth + 1) + ")"
+        return "(" + randomPredicate(rng, depth + 1) + " " + kind + " " + randomPredicate(rng, depth + 1) + ")"
+    prop = rng.choice(["gender", "age", "income", "city"])
+    if rng.random() < 0.1:
+        return "n." + prop + rng.choice([" IS NULL", " IS NOT NULL"])
+    op = rng.choice(["=", "<>", "<", "<=", ">", ">="])
+    if prop == "gender":
+        value = repr(rng.choice(["Male", "Female", "Other"]))
+    elif prop == "city":
+        value = repr(rng.choice(cities[:-1] + ["Paris"]))
+    elif prop == "age":
+        value = str(rng.choice([rng.randint(15, 75), rng.randint(15, 75) + 0.5]))
+    else:
+        value = str(rng.choice([rng.randrange(5, 95) * 100, round(rng.uniform(500, 9500), 2)]))
+    return "n." + prop + " " + op + " " + value
+
+
+def assertCubeMatchesScan(g, rng, queries=300):
+    answered = 0
+    for _ in range(queries):
+        query = "MATCH (n:Person) WHERE " + randomPredicate(rng) + " RETURN count(n)"
+        answer = g.cube.count(query, {})
+        if answer is not None:
+            answered += 1
+            assert answer == scan(g, query), query
+    return answered
+
+
+def testCubeMatchesScan(graph):
+    g, _, _ = graph
+    answered = assertCubeMatchesScan(g, random.Random(1))
+    assert answered > 150  # values off the bucket edges fall back to the scan
+    assert g.cube.count("MATCH (n:Person) RETURN count(n)", {}) == 150
+    assert g.cube.count(q1, {}) is None  # also counts the Companies, which the cube does not hold
+    assert g.cube.count("MATCH (n:Person) WHERE n.name = 'A1' RETURN count(n)", {}) is None
+
+
+def testCubeFollowsWritesAndRestores():
+    g, _, _ = buildGraph(seed=3)
+    rng = random.Random(2)
+    base = g.snapshot()
+    g.createPersons([{"name": "k" + str(i), "gender": "Female", "age": rng.randint(20, 80), "city": "Springfield",
+                      "income": round(rng.uniform(1000, 9000), 2)} for i in range(40)])
+    assertCubeMatchesScan(g, rng, 100)
+    g.restore(base)
+    assert g.cube.count("MATCH (n:Person) RETURN count(n)", {}) == 150
+    assertCubeMatchesScan(g, rng, 100)
+
+
+def testStaleSnapshotIsCopiedBack():
+    g, _, _ = buildGraph(seed=4)
+    older = g.snapshot()
+    g.createPersons([{"name": "x", "age": 1}])
+    newer = g.snapshot()
+    g.restore(older)
+    g.createPersons([{"name": "y", "age": 2}])
+    g.restore(newer)
+    assert scan(g, "MATCH (n) WHERE n.age = 1 RETURN count(n)") == 1
+    assert scan(g, "MATCH (n) WHERE n.age = 2 RETURN count(n)") == 0
+    assert g.cube.count("MATCH (n:Person) WHERE n.age = 1 RETURN count(n)", {}) == 1
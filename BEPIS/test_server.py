@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+from server import buildPools, PrivacyQueryServer
+
+'''
+Tests of the privacy query server: budgets are never overspent, eps is fixed, responses never reveal anything but
+the noisy answers and the remaining budget, and only batches built by the server are treated as disjoint.
+'''
+
+
+@pytest.fixture
+def server():
+    pools = buildPools(["UserData.csv"], "memory", 2, None, None, None, 100)
+    return PrivacyQueryServer(pools, initialBudget=10, workers=4, seed=1)
+
+
+def ask(server, *requests):
+    async def answerAll():
+        return await asyncio.gather(*(server.handleRequest(json.dumps(request)) for request in requests))
+    return asyncio.run(answerAll())
+
+
+def testServerBudgetIsNeverOverspent(server):
+    responses = ask(server, *({"analyst": "alice", "query": "1"} for _ in range(30)))
+    assert sum(response["ok"] for response in responses) == 10
+    assert ask(server, {"budget": True, "analyst": "alice"})[0]["remainingBudget"] == 0
+    assert ask(server, {"budget": True, "analyst": "bob"})[0]["remainingBudget"] == 10
+
+
+def testServerExhaustsTheBudgetOfNonCountingQueries(server):
+    response, = ask(server, {"analyst": "mallory", "query": "MATCH (n) RETURN n.name"})
+    assert not response["ok"] and response["remainingBudget"] == 0
+
+
+def testServerFixesEps(server):
+    rejected, accepted = ask(server, {"query": "1", "eps": 1e9}, {"query": "1", "eps": 0.1})
+    assert not rejected["ok"] and accepted["ok"]
+    assert not ask(server, {"queries": ["1"], "eps": 5})[0]["ok"]
+
+
+def testServerOnlyReleasesNoisyAnswers(server):
+    single, batch = ask(server, {"id": 1, "analyst": "carol", "query": "3", "sensitivity": "2"},
+                        {"id": 2, "analyst": "carol", "queries": ["1", "2"], "sensitivity": 2.5})
+    assert set(single) == {"id", "ok", "answer", "remainingBudget", "latencyMs"}
+    assert set(batch) == {"id", "ok", "answers", "remainingBudget", "latencyMs"}
+    # The cost only depends on the requested sensitivity, never on the counts
+    assert ask(server, {"budget": True, "analyst": "carol"})[0]["remainingBudget"] == 6
+    computed, = ask(server, {"analyst": "dave", "query": "1", "sensitivity": "1"})
+    assert not computed["ok"] and "answer" not in computed
+    assert ask(server, {"budget": True, "analyst": "dave"})[0]["remainingBudget"] == 10
+
+
+def testServerBatchesSplitEpsUnlessBuiltDisjoint(server):
+    query = "MATCH (n:Person) WHERE n.gender = 'Male' RETURN count(n)"
+    rejected, = ask(server, {"analyst": "eve", "queries": [query] * 50, "disjoint": True})
+    assert not rejected["ok"]
+    batch, = ask(server, {"analyst": "eve", "queries": [query] * 5})
+    assert batch["ok"] and batch["remainingBudget"] == 9
+    partition, = ask(server, {"analyst": "eve", "partition": {"property": "gender", "values": ["Male", "Female"]}})
+    assert partition["ok"] and len(partition["answers"]) == 2 and partition["remainingBudget"] == 8
+    repeated, bands = ask(server, {"partition": {"property": "gender", "values": ["Male", "Male"]}},
+                          {"bands": {"property": "age", "edges": [30, 30, 40]}})
+    assert not repeated["ok"] and not bands["ok"]
+
+
+def testServerPoolAnswersFromTheCube(server):
+    g = server.pools["UserData.csv"].connections[0]
+    queries = [("MATCH (n:Person) WHERE n.gender = 'Male' RETURN count(n)", {}),
+               ("MATCH (n:Person) WHERE n.age >= $age AND n.income < 5000 RETURN count(n)", {"age": 40})]
+    cube, g.cube = g.cube, None
+    try:
+        scanned = [g.count(query, **params) for query, params in queries]
+    finally:
+        g.cube = cube
+    hits = g.cube.hits
+    assert g.countMany(queries) == scanned
+    assert g.cube.hits == hits + 2
@@ -0,0 +1,126 @@
+import itertools
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+import numpy as np
+
+'''
+Tracing of the phases of a private query in BEPIS (load, k-distance, sensitivity, true count, noise, budget).
+    with tracer.span("sensitivity", query=template.text):
+        ...
+Every span records its wall time, the database round trips done inside of it and the Cypher text, row count and
+duration of each statement, reported by the graph backend the tracer is attached to (g.tracer = tracer).
+Spans nest, a span without a parent starts a new trace. Finished spans are kept as structured events, feed one
+rolling window of durations per phase and are written as JSON lines if an export path is given.
+The current span is kept in a context variable, so concurrent requests of the query server are traced apart.
+A disabled tracer returns a shared no-op context manager and ignores statements.
+'''
+
+currentSpan = ContextVar("currentSpan", default=None)
+noSpan = nullcontext()
+
+# Bucket edges of histogram(): 1 microsecond to 100 seconds, 4 buckets per decade
+defaultEdges = np.logspace(-6, 2, 33)
+
+
+class Span:
+    def __init__(self, tracer, phase, attributes):
+        self.tracer = tracer
+        self.phase = phase
+        self.attributes = attributes
+        self.parent = None
+        self.trace = None
+        self.statements = []
+        self.roundTrips = 0
+        self.rows = 0
+        self.started = 0.0
+        self.start = 0.0
+        self.token = None
+
+    def __enter__(self):
+        self.parent = currentSpan.get()
+        self.trace = self.parent.trace if self.parent is not None else next(self.tracer.traceIds)
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.token = currentSpan.set(self)
+        return self
+
+    def __exit__(self, *exception):
+        seconds = time.perf_counter() - self.start
+        currentSpan.reset(self.token)
+        if self.parent is not None:
+            self.parent.roundTrips += self.roundTrips
+            self.parent.rows += self.rows
+        event = {"event": "span", "trace": self.trace, "phase": self.phase,
+                 "parent": self.parent.phase if self.parent is not None else None, "started": self.started,
+                 "seconds": seconds, "roundTrips": self.roundTrips, "rows": self.rows,
+                 "statements": self.statements, "error": exception[0].__name__ if exception[0] else None}
+        event.update(self.attributes)
+        self.tracer.finished(event)
+        return False
+
+
+class Tracer:
+    def __init__(self, enabled=True, exportPath=None, window=1000, keepEvents=10000):
+        self.enabled = enabled
+        self.window = window
+        self.events = deque(maxlen=keepEvents)
+        self.durations = {}  # phase -> rolling window of seconds
+        self.roundTrips = {}  # phase -> database round trips of all its spans
+        self.traceIds = itertools.count(1)
+        self.exportFile = open(exportPath, 'a') if enabled and exportPath else None
+
+    def span(self, phase, **attributes):
+        if not self.enabled:
+            return noSpan
+        return Span(self, phase, attributes)
+
+    def statement(self, text, rows, seconds):
+        # Called by the backend for every statement sent to the database
+        if not self.enabled:
+            return
+        span = currentSpan.get()
+        if span is None:
+            with self.span("statement"):
+                self.statement(text, rows, seconds)
+            return
+        span.roundTrips += 1
+        span.rows += rows
+        span.statements.append({"text": text, "rows": rows, "seconds": seconds})
+
+    def finished(self, event):
+        self.events.append(event)
+        if event["phase"] not in self.durations:
+            self.durations[event["phase"]] = deque(maxlen=self.window)
+        self.durations[event["phase"]].append(event["seconds"])
+        self.roundTrips[event["phase"]] = self.roundTrips.get(event["phase"], 0) + event["roundTrips"]
+        if self.exportFile is not None:
+            self.exportFile.write(json.dumps(event, default=str) + "\n")
+
+    def histogram(self, phase, edges=defaultEdges):
+        # Counts of the recent durations of phase per bucket [edges[i], edges[i + 1])
+        counts, _ = np.histogram(np.asarray(self.durations.get(phase, ())), bins=edges)
+        return counts
+
+    def summary(self):
+        result = {}
+        for phase, durations in self.durations.items():
+            times = np.asarray(durations) * 1000
+            p50, p95, p99 = np.percentile(times, [50, 95, 99])
+            result[phase] = {"count": len(times), "p50Ms": p50, "p95Ms": p95, "p99Ms": p99, "maxMs": times.max(),
+                             "roundTrips": self.roundTrips[phase]}
+        return result
+
+    def report(self):
+        for phase, summary in self.summary().items():
+            print(phase.capitalize() + ": " + str(summary["count"]) + " times, p50 " +
+                  str(round(summary["p50Ms"], 3)) + " ms, p95 " + str(round(summary["p95Ms"], 3)) + " ms, p99 " +
+                  str(round(summary["p99Ms"], 3)) + " ms, " + str(summary["roundTrips"]) + " round trips")
+
+    def close(self):
+        if self.exportFile is not None:
+            self.exportFile.close()
+            self.exportFile = None
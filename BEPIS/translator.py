@@ -0,0 +1,102 @@
+import re
+from collections import OrderedDict
+
+'''
+Query translation for BEPIS.
+User queries are turned into parameterised templates: every string and number literal becomes a parameter
+($p0, $p1, ...), so queries that only differ in their values share one stable query text and Neo4j can reuse
+the cached plan. Values never end up in the query text, which also keeps quotes in names from breaking queries.
+Translated templates are cached client side; the statements sent to the backend are tracked to report the
+translation cache and the (estimated) plan cache hit rates.
+'''
+
+# The bounds of variable length relationships, e.g. [*2] or [r:Friends*1..3], cannot be parameters and are matched
+# first, so their numbers are kept
+literalPattern = re.compile(r"""\*\s*\d*\s*(?:\.\.\s*\d*\s*)?(?=[\]{])|'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|"""
+                            r"""(?<![\w$.])\d+(?:\.\d+)?(?![\w.])""")
+
+# Neo4j keeps 1000 query plans by default (dbms.query_cache_size)
+defaultPlanCacheSize = 1000
+
+
+class QueryTemplate:
+    def __init__(self, query, text, params):
+        self.query = query  # the query as typed by the user
+        self.text = text  # stable, parameterised query text
+        self.params = params
+
+
+def unquote(literal):
+    return re.sub(r"\\(.)", r"\1", literal[1:-1])
+
+
+def parameterise(query):
+    '''
+    Replaces the literals of query by parameters and returns the template text and the parameter values.
+    Relationship length bounds stay in the text.
+    '''
+    params = {}
+
+    def replace(match):
+        literal = match.group(0)
+        if literal[0] == "*":
+            return literal
+        name = "p" + str(len(params))
+        if literal[0] in "'\"":
+            params[name] = unquote(literal)
+        else:
+            params[name] = float(literal) if "." in literal else int(literal)
+        return "$" + name
+
+    text = literalPattern.sub(replace, query.strip().rstrip(";"))
+    return " ".join(text.split()), params
+
+
+class QueryTranslator:
+    def __init__(self, maxTemplates=256, planCacheSize=defaultPlanCacheSize):
+        self.maxTemplates = maxTemplates
+        self.planCacheSize = planCacheSize
+        self.templates = OrderedDict()  # user query -> QueryTemplate
+        self.plans = OrderedDict()  # statement text -> executions, mirrors the server side plan cache
+        self.templateHits = 0
+        self.templateMisses = 0
+        self.planHits = 0
+        self.planMisses = 0
+
+    def translate(self, query):
+        template = self.templates.get(query)
+        if template is not None:
+            self.templateHits += 1
+            self.templates.move_to_end(query)
+            return template
+        self.templateMisses += 1
+        text, params = parameterise(query)
+        template = QueryTemplate(query, text, params)
+        self.templates[query] = template
+        while len(self.templates) > self.maxTemplates:
+            self.templates.popitem(last=False)
+        return template
+
+    def statementSent(self, text):
+        # Called by the backend for every statement, a text seen before can reuse its cached plan
+        if text in self.plans:
+            self.planHits += 1
+            self.plans.move_to_end(text)
+        else:
+            self.planMisses += 1
+        self.plans[text] = self.plans.get(text, 0) + 1
+        while len(self.plans) > self.planCacheSize:
+            self.plans.popitem(last=False)
+
+    def templateHitRate(self):
+        total = self.templateHits + self.templateMisses
+        return self.templateHits / total if total else 0.0
+
+    def planHitRate(self):
+        total = self.planHits + self.planMisses
+        return self.planHits / total if total else 0.0
+
+    def report(self):
+        print("Translated templates: " + str(len(self.templates)) + ", hit rate " + str(self.templateHitRate()))
+        print("Statements: " + str(len(self.plans)) + " distinct texts, plan cache hit rate " +
+              str(self.planHitRate()))